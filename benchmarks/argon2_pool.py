@@ -0,0 +1,93 @@
+"""
+Benchmark: Argon2 en el event loop vs en el pool (PasswordService)
+
+Para cada perfil de parámetros mide:
+  - latencia de 1 hash (mediana)
+  - una ráfaga de --requests verificaciones concurrentes (como un pico de
+    sign-ins): tiempo total, verificaciones/s y el peor atraso del event
+    loop (un ticker que duerme 5ms mide cuánto tarda de más en despertar;
+    es lo que esperaría el fan-out de los websockets)
+    * inline: ph.verify dentro de la corutina (como antes)
+    * pool:   PasswordService con --workers threads
+
+Run with:
+    python -m benchmarks.argon2_pool --requests 24 --workers 0
+(--workers 0 = automático, min(4, cpus))
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from argon2 import PasswordHasher
+
+from features.auth.utils.password_service import PasswordService
+
+PROFILES = (
+    # (nombre, time_cost, memory_cost KiB, parallelism)
+    ("argon2-cffi default", 3, 65536, 4),
+    ("t=3 m=64MiB p=1", 3, 65536, 1),
+    ("t=2 m=19MiB p=1", 2, 19456, 1),
+)
+
+PASSWORD = "Correct-Horse-Battery-9!" + "pepper"
+
+
+async def loop_lag(stop: asyncio.Event) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.005)
+        worst = max(worst, time.perf_counter() - start - 0.005)
+    return worst * 1000
+
+
+async def burst(verify, hashed: str, requests: int) -> tuple:
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(loop_lag(stop))
+    await asyncio.sleep(0.01)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(verify(hashed) for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    return elapsed, await ticker
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=24)
+    parser.add_argument("--workers", type=int, default=0)
+    args = parser.parse_args()
+
+    for name, time_cost, memory_cost, parallelism in PROFILES:
+        ph = PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+        service = PasswordService(ph, workers=args.workers, max_pending=args.requests)
+        hashed = ph.hash(PASSWORD)
+
+        samples = []
+        for _ in range(5):
+            start = time.perf_counter()
+            ph.hash(PASSWORD)
+            samples.append((time.perf_counter() - start) * 1000)
+
+        async def inline(h):
+            ph.verify(h, PASSWORD)
+
+        async def pooled(h):
+            ok, _ = await service.verify(h, PASSWORD)
+            assert ok
+
+        print(f"{name} (1 hash: {statistics.median(samples):.1f}ms, workers={service.workers})")
+        for label, verify in (("inline", inline), ("pool", pooled)):
+            elapsed, lag = await burst(verify, hashed, args.requests)
+            print(
+                f"  {label:6s} {args.requests} verifies in {elapsed * 1000:7.1f}ms "
+                f"({args.requests / elapsed:6.1f}/s)  worst loop lag {lag:7.1f}ms"
+            )
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
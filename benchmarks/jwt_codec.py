@@ -0,0 +1,63 @@
+"""
+Benchmark: firma y verificación de JWT por backend (ops/sec)
+
+Compara los codecs de features/auth/utils/token_codec.py (native, jose y,
+si están instalados, pyjwt y joserfc) con el mismo payload que arma
+encode_token. Verifica además que los tokens sean intercambiables entre
+backends (uno firma, los demás verifican).
+
+Run with:
+    JWT_SECRET_KEY=... ALGORITHM=HS256 python -m benchmarks.jwt_codec --ops 20000
+"""
+import argparse
+import time
+
+from shared.settings import settings
+from features.auth.utils.token_codec import BACKENDS, make_token_codec
+
+
+def build_claims() -> dict:
+    iat = int(time.time())
+    return {
+        "sub": "6f1c2a0e-3b7d-4a57-9a53-2f9f1f0c8e11",
+        "iat": iat,
+        "exp": iat + 3600,
+        "metadata": {"role": "manager", "org_id": "a3c4b1e2-7f0d-4e2b-9c61-0d7f7b6a9e55"},
+    }
+
+
+def ops_per_sec(fn, ops: int) -> float:
+    start = time.perf_counter()
+    for _ in range(ops):
+        fn()
+    return ops / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ops", type=int, default=20000)
+    args = parser.parse_args()
+
+    claims = build_claims()
+    codecs = {}
+    for backend in BACKENDS[1:]:
+        try:
+            codecs[backend] = make_token_codec(backend, settings.ALGORITHM, settings.JWT_SECRET_KEY)
+        except (RuntimeError, ValueError) as e:
+            print(f"{backend:8s} skipped ({e})")
+
+    for signer_name, signer in codecs.items():
+        token = signer.encode(claims)
+        for verifier_name, verifier in codecs.items():
+            assert verifier.decode(token)["sub"] == claims["sub"], (signer_name, verifier_name)
+
+    print(f"Algorithm: {settings.ALGORITHM}, ops: {args.ops}")
+    for name, codec in codecs.items():
+        token = codec.encode(claims)
+        sign = ops_per_sec(lambda: codec.encode(claims), args.ops)
+        verify = ops_per_sec(lambda: codec.decode(token), args.ops)
+        print(f"{name:8s} sign {sign:>10,.0f} ops/s ({1e6 / sign:5.1f}us)   verify {verify:>10,.0f} ops/s ({1e6 / verify:5.1f}us)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark: requests/sec con el stack de middlewares de main.py
+
+Arma una app con una ruta trivial pública (/health) y una autenticada
+(/v1/ping, Bearer JWT), con los mismos middlewares y en el mismo orden que
+main.py (DenyDotfile, CORS, RequestLogger, VerifyToken, RateLimit), y mide
+requests/sec en proceso (ASGI, sin red) contra un Redis local, con y sin
+el stack.
+
+Run with:
+    REDIS_URL=redis://localhost:6379/15 python -m benchmarks.middleware_stack \
+        --requests 5000 --concurrency 50
+(la db indicada en REDIS_URL se vacía al terminar)
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+
+from shared.redis.redis_client import redis_client
+from shared.middlewares.rate_limiter import RateLimitMiddleware
+from shared.middlewares.requests_logger import RequestLoggerMiddleware
+from shared.middlewares.deny_dotfiles import DenyDotfileMiddleware
+from features.auth.middlewares.verify_token import VerifyToken
+from features.auth.utils import encode_token
+
+
+def build_app(with_stack: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health():
+        return {"ok": True}
+
+    @app.get("/v1/ping")
+    async def ping():
+        return {"ok": True}
+
+    if with_stack:
+        app.add_middleware(RateLimitMiddleware, default_limit=10**9, default_window=60)
+        app.add_middleware(VerifyToken)
+        app.add_middleware(RequestLoggerMiddleware)
+        app.add_middleware(
+            CORSMiddleware,
+            allow_origins=["https://web.gt360.app"],
+            allow_credentials=True,
+            allow_methods=["*"],
+            allow_headers=["*"],
+        )
+        app.add_middleware(DenyDotfileMiddleware)
+    return app
+
+
+async def run(app: FastAPI, path: str, headers: dict, requests: int, concurrency: int) -> tuple:
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+        # warm-up (compilación de rutas, scripts, conexiones)
+        for _ in range(50):
+            await client.get(path)
+
+        async def one():
+            async with sem:
+                start = time.perf_counter()
+                resp = await client.get(path)
+                latencies.append((time.perf_counter() - start) * 1000)
+                assert resp.status_code == 200, resp.text
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return requests / elapsed, latencies
+
+
+def summary(rps: float, latencies: list) -> str:
+    return (
+        f"{rps:,.0f} req/s  "
+        f"p50={statistics.median(latencies):.2f}ms "
+        f"p95={latencies[int(len(latencies) * 0.95) - 1]:.2f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    token = encode_token("bench-user", {"role": "manager"})["access_token"]
+    auth = {"Authorization": f"Bearer {token}"}
+
+    print(f"Requests: {args.requests}, concurrency={args.concurrency}")
+    for label, path, headers in (("public /health", "/health", {}), ("auth /v1/ping", "/v1/ping", auth)):
+        bare = await run(build_app(False), path, headers, args.requests, args.concurrency)
+        stacked = await run(build_app(True), path, headers, args.requests, args.concurrency)
+        print(f"{label:16s} no middlewares: {summary(*bare)}")
+        print(f"{label:16s} full stack:     {summary(*stacked)}")
+
+    await redis_client.flushdb()
+    await redis_client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
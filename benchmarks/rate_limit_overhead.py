@@ -0,0 +1,124 @@
+"""
+Benchmark: overhead del RateLimitMiddleware por request
+
+Llama GET /ping en proceso (ASGI, sin red) con y sin el middleware, contra
+un Redis local, y reporta la diferencia (latencia media y p50/p95). Aparte
+mide solo el chequeo contra Redis: la secuencia anterior (INCR + EXPIRE +
+TTL) contra el script Lua (1 EVALSHA), y cuántos EVALSHA llegan a Redis
+por request con el tier local (--lease-max 1 lo desactiva).
+
+Run with:
+    REDIS_URL=redis://localhost:6379/15 python -m benchmarks.rate_limit_overhead \
+        --requests 5000 --algorithm fixed --lease-max 50
+(la db indicada en REDIS_URL se vacía al terminar)
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from shared.redis.redis_client import redis_client
+from shared.middlewares.rate_limiter import RateLimitMiddleware
+from shared.redis.rate_limit import hit
+
+
+def build_app(rate_limited: bool, algorithm: str | None, lease_max: int | None = None) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    if rate_limited:
+        options = {"default_limit": 10**9, "default_window": 60}
+        if algorithm:
+            options["algorithm"] = algorithm
+        if lease_max is not None:
+            options["lease_max"] = lease_max
+        app.add_middleware(RateLimitMiddleware, **options)
+    return app
+
+
+async def run(app: FastAPI, requests: int) -> list:
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # warm-up (carga de scripts, conexiones)
+        for _ in range(50):
+            await client.get("/ping")
+
+        for _ in range(requests):
+            start = time.perf_counter()
+            resp = await client.get("/ping")
+            latencies.append((time.perf_counter() - start) * 1_000_000)
+            assert resp.status_code == 200, resp.text
+    latencies.sort()
+    return latencies
+
+
+async def legacy_check(key: str, limit: int, window: int) -> None:
+    current = await redis_client.incr(key)
+    if current == 1:
+        await redis_client.expire(key, window)
+    await redis_client.ttl(key)
+
+
+async def check_only(requests: int, algorithm: str | None) -> tuple:
+    """Latencia media (us) del chequeo solo: (secuencia anterior, script Lua)."""
+    async def timed(fn) -> float:
+        start = time.perf_counter()
+        for _ in range(requests):
+            await fn()
+        return (time.perf_counter() - start) / requests * 1_000_000
+
+    legacy = await timed(lambda: legacy_check("bench:legacy", 10**9, 60))
+    lua = await timed(lambda: hit(redis_client, "bench:lua", 10**9, 60, algorithm or "fixed"))
+    return legacy, lua
+
+
+async def evalsha_calls() -> int:
+    stats = await redis_client.info("commandstats")
+    return stats.get("cmdstat_evalsha", {}).get("calls", 0)
+
+
+def summary(latencies: list) -> str:
+    return (
+        f"mean={statistics.fmean(latencies):.0f}us "
+        f"p50={statistics.median(latencies):.0f}us "
+        f"p95={latencies[int(len(latencies) * 0.95) - 1]:.0f}us"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--algorithm", default=None, help="fixed | sliding | token_bucket")
+    parser.add_argument("--lease-max", type=int, default=None, help="1 = sin tier local")
+    args = parser.parse_args()
+
+    base = await run(build_app(False, None), args.requests)
+    evalsha_before = await evalsha_calls()
+    limited = await run(build_app(True, args.algorithm, args.lease_max), args.requests)
+    evalsha = await evalsha_calls() - evalsha_before
+
+    print(
+        f"Requests: {args.requests} sequential, algorithm={args.algorithm or 'default'}, "
+        f"lease_max={args.lease_max if args.lease_max is not None else 'default'}"
+    )
+    print(f"Without middleware: {summary(base)}")
+    print(f"With middleware:    {summary(limited)}")
+    print(f"Overhead per request: {statistics.fmean(limited) - statistics.fmean(base):.0f}us (mean)")
+    print(f"EVALSHA per request: {evalsha / (args.requests + 50):.3f}")
+
+    legacy, lua = await check_only(args.requests, args.algorithm)
+    print(f"Redis check only: INCR+EXPIRE+TTL={legacy:.0f}us  EVALSHA={lua:.0f}us")
+
+    await redis_client.flushdb()
+    await redis_client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
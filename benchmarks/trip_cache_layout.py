@@ -0,0 +1,134 @@
+"""
+Benchmark: trip cache layout "keys" (trip:{id} + set) vs "hash" (1 hash por location)
+
+Siembra el mismo dataset en ambos layouts y compara:
+1. Memoria (MEMORY USAGE de todas las keys de cada layout)
+2. Latencia de snapshot (leer todos los trips de una location)
+3. Latencia de escritura (pipeline con un batch de updates)
+
+Usa una base de Redis dedicada (por defecto db 15) y la vacía al empezar.
+
+Run with:
+    REDIS_URL=redis://localhost:6379/15 python -m benchmarks.trip_cache_layout --locations 20 --trips 800
+(la db indicada en REDIS_URL se vacía; default redis://localhost:6379/15)
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+import uuid
+
+import redis.asyncio as aioredis
+
+from shared.redis.trip_cache import cache_trip, touch_location, iter_cached_trips
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/15")
+
+
+def fake_trip(location_id: str, i: int) -> dict:
+    trip_id = str(uuid.uuid4())
+    return {
+        "id": trip_id,
+        "assigned_driver": None,
+        "location_id": location_id,
+        "pick_up_date": "2026-01-01",
+        "pick_up_time": f"{i % 24:02d}:{i % 60:02d}:00",
+        "pick_up_location": "Hyatt Regency Louisville",
+        "drop_off_location": "SDF",
+        "airline": "WN",
+        "flight_number": str(1000 + i),
+        "riders": {"fligth": 2, "in_fligth": 3},
+        "started_at": None,
+        "picked_up_at": None,
+        "dropped_off_at": None,
+        "created_at": "2026-01-01T06:53:46.326605+00:00",
+        "updated_at": "2026-01-01T06:53:46.326605+00:00",
+    }
+
+
+async def seed(r, layout: str, dataset: dict) -> None:
+    for location_id, trips in dataset.items():
+        pipe = r.pipeline(transaction=False)
+        for trip in trips:
+            cache_trip(pipe, location_id, trip["id"], json.dumps(trip), layout=layout)
+        touch_location(pipe, location_id, layout=layout)
+        await pipe.execute()
+
+
+async def memory_usage(r) -> int:
+    total = 0
+    async for key in r.scan_iter(count=1000):
+        total += await r.memory_usage(key, samples=0) or 0
+    return total
+
+
+async def snapshot_latency(r, layout: str, dataset: dict, rounds: int) -> list:
+    samples = []
+    for _ in range(rounds):
+        for location_id in dataset:
+            start = time.perf_counter()
+            n = 0
+            async for trips, _missing in iter_cached_trips(r, location_id, 500, layout=layout):
+                n += len(trips)
+            samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+async def write_latency(r, layout: str, dataset: dict, batch: int) -> list:
+    samples = []
+    for location_id, trips in dataset.items():
+        pipe = r.pipeline(transaction=False)
+        for trip in trips[:batch]:
+            cache_trip(pipe, location_id, trip["id"], json.dumps(trip), layout=layout)
+        touch_location(pipe, location_id, layout=layout)
+        start = time.perf_counter()
+        await pipe.execute()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def fmt(samples: list) -> str:
+    samples = sorted(samples)
+    p95 = samples[max(0, int(len(samples) * 0.95) - 1)]
+    return f"p50={statistics.median(samples):7.2f}ms p95={p95:7.2f}ms"
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--locations", type=int, default=20)
+    parser.add_argument("--trips", type=int, default=800)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args()
+
+    r = aioredis.from_url(REDIS_URL, decode_responses=True)
+    dataset = {
+        str(uuid.uuid4()): [fake_trip("", i) for i in range(args.trips)]
+        for _ in range(args.locations)
+    }
+    for location_id, trips in dataset.items():
+        for trip in trips:
+            trip["location_id"] = location_id
+
+    print(f"Dataset: {args.locations} locations x {args.trips} trips ({REDIS_URL})")
+    print("-" * 72)
+
+    for layout in ("keys", "hash"):
+        await r.flushdb()
+        await seed(r, layout, dataset)
+        mem = await memory_usage(r)
+        keys = await r.dbsize()
+        snap = await snapshot_latency(r, layout, dataset, args.rounds)
+        write = await write_latency(r, layout, dataset, args.batch)
+        print(f"[{layout:>4}] keys={keys:7d} memory={mem / 1024 / 1024:7.2f}MiB")
+        print(f"       snapshot ({args.trips} trips): {fmt(snap)}")
+        print(f"       write    ({args.batch} updates): {fmt(write)}")
+
+    await r.flushdb()
+    await r.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
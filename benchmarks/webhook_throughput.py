@@ -0,0 +1,117 @@
+"""
+Benchmark: throughput del webhook de trips (events/sec)
+
+Llama a POST /v1/webhooks/trips/batch en proceso (ASGI, sin red) con batches
+firmados, contra un Redis local. Mide events/sec y latencia por batch.
+
+Run with:
+    REDIS_URL=redis://localhost:6379/15 python -m benchmarks.webhook_throughput \
+        --batches 300 --batch-size 100 --locations 40
+(la db indicada en REDIS_URL se vacía al terminar)
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import statistics
+import time
+import uuid
+
+import httpx
+import orjson
+from fastapi import FastAPI
+
+from shared.settings import settings
+from shared.redis.redis_client import redis_client
+from features.trips.webhooks.trip_webhooks import webhook
+
+
+def build_batch(locations: list, size: int, seq: int) -> dict:
+    events = []
+    for i in range(size):
+        location_id = locations[i % len(locations)]
+        trip_id = str(uuid.uuid4())
+        events.append({
+            "event_id": str(uuid.uuid4()),
+            "event_type": "update",
+            "trip_id": trip_id,
+            "location_id": location_id,
+            "trip": {
+                "id": trip_id,
+                "location_id": location_id,
+                "pick_up_date": "2026-01-01",
+                "pick_up_time": "04:10:00",
+                "pick_up_location": "Hyatt Regency Louisville",
+                "drop_off_location": "SDF",
+                "airline": "WN",
+                "flight_number": str(1000 + i),
+                "riders": {"fligth": 2, "in_fligth": 3},
+                "updated_at": "2026-01-01T06:53:46.326605+00:00",
+            },
+        })
+    return {"batch_id": str(uuid.uuid4()), "sent_at": seq, "source": "bench", "events": events}
+
+
+def sign(body: bytes) -> str:
+    ts = int(time.time())
+    sig = hmac.new(settings.WEBHOOK_SECRET.encode("utf-8"), f"{ts}.".encode("utf-8") + body, hashlib.sha256).hexdigest()
+    return f"t={ts},v1={sig}"
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batches", type=int, default=300)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--locations", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+
+    app = FastAPI()
+    app.include_router(webhook)
+
+    locations = [str(uuid.uuid4()) for _ in range(args.locations)]
+    bodies = [
+        orjson.dumps(build_batch(locations, args.batch_size, n))
+        for n in range(args.batches)
+    ]
+
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def post(body: bytes):
+            start = time.perf_counter()
+            resp = await client.post(
+                "/v1/webhooks/trips/batch",
+                content=body,
+                headers={"Content-Type": "application/json", "x-webhook-secret": sign(body)},
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert resp.status_code == 200 and resp.json().get("ok"), resp.text
+
+        # warm-up (carga de scripts, conexiones)
+        await post(bodies[0])
+        latencies.clear()
+
+        sem = asyncio.Semaphore(args.concurrency)
+
+        async def worker(body: bytes):
+            async with sem:
+                await post(body)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(b) for b in bodies))
+        elapsed = time.perf_counter() - start
+
+    total_events = args.batches * args.batch_size
+    latencies.sort()
+    print(f"Batches: {args.batches} x {args.batch_size} events, {args.locations} locations, concurrency={args.concurrency}")
+    print(f"Throughput: {total_events / elapsed:,.0f} events/sec ({args.batches / elapsed:,.1f} batches/sec)")
+    print(f"Latency per batch: p50={statistics.median(latencies):.2f}ms p95={latencies[int(len(latencies) * 0.95) - 1]:.2f}ms")
+
+    await redis_client.flushdb()
+    await redis_client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,29 +1,39 @@
-from fastapi import  Request, FastAPI, Response
+from fastapi import  Request
 from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
 from shared.settings import settings
-from starlette.middleware.base import BaseHTTPMiddleware
 
-from features.auth.utils import get_token, decode_token
+from features.auth.utils import get_token, verified_tokens
 
-class VerifyToken(BaseHTTPMiddleware):
-    def __init__(self, app: FastAPI) -> None:
-        super().__init__(app)
+class VerifyToken:
+    """
+    Middleware ASGI puro: valida el JWT de los requests HTTP a rutas no
+    públicas y deja el usuario en request.state.user_data.
+    """
 
-    async def dispatch(self, request: Request, call_next) -> Response | JSONResponse:
-        if request.method == "OPTIONS":
-            return await call_next(request)
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.public_paths = tuple(settings.PUBLIC_PATHS)
 
-        if not request.url.path.startswith(tuple(settings.PUBLIC_PATHS)):
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        if not scope["path"].startswith(self.public_paths):
+            request = Request(scope)
             try:
                 token = get_token(request)
-                payload = decode_token(token)
+                # firma verificada 1 vez por token (cache hasta exp) + blacklist
+                payload = await verified_tokens.verify(token)
             except ValueError as e:
-                return JSONResponse(status_code=401, content={"detail":str(e)})
+                response = JSONResponse(status_code=401, content={"detail":str(e)})
+                await response(scope, receive, send)
+                return
 
-            request.state.user_data = payload.get("metadata") or {}
+            # request.state vive en scope["state"]: lo ven los handlers
+            # copia: los claims son compartidos con la cache
+            request.state.user_data = dict(payload.get("metadata") or {})
             request.state.user_data.update({"id": payload.get("sub")})
-            print(request.state.user_data)
-        
 
-        response = await call_next(request)
-        return response
+        await self.app(scope, receive, send)
@@ -33,7 +33,7 @@ async def register_crew_member(
     except ValueError as e:
         raise HTTPException(status_code=409, detail=str(e))
 
-    hashed_pass = hash_pwd(user_data.password)
+    hashed_pass = await hash_pwd(user_data.password)
 
     try:
         user = User(
@@ -82,7 +82,7 @@ async def register_manager(
     session: AsyncSession = Depends(get_db)
     ) -> dict:
 
-    hashed_pass = hash_pwd(user_data.password)
+    hashed_pass = await hash_pwd(user_data.password)
 
     try:
         user = User(
@@ -231,7 +231,7 @@ async def sign_out(
     token = get_token(request)
 
     try:
-        await blacklist_token(token, exp_seconds=300)
+        await blacklist_token(token)
     except ValueError as e:
         raise HTTPException(status_code=403, detail=str(e))
 
@@ -320,11 +320,10 @@ async def change_password(
     
     if not await verify_password(session, data.current_password, user.password_hash, user_id):
         raise HTTPException(status_code=403, detail="Incorrect current password")
-    
-    if await verify_password(session, data.new_password, user.password_hash, user_id):
-        raise HTTPException(status_code=409, detail="The new password must be different from your current password.")
 
-    user.password_hash = hash_pwd(data.new_password)
+    # new_password != current_password (ya validado) y current_password coincide
+    # con el hash: verificar también new_password contra el mismo hash era redundante
+    user.password_hash = await hash_pwd(data.new_password)
     session.add(user)
 
     # Revocar todos los refresh tokens
@@ -466,7 +465,7 @@ async def reset_password(
     if await verify_password(session, new_password, user.password_hash, user.id):
         raise HTTPException(status_code=409, detail="The new password must be different from your current password.")
     
-    user.password_hash = hash_pwd(new_password)
+    user.password_hash = await hash_pwd(new_password)
     user.updated_at = now()
 
     await revoke_all_user_refresh(session, user.id)
@@ -0,0 +1,101 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from argon2 import PasswordHasher, extract_parameters
+from argon2.exceptions import InvalidHashError, VerificationError
+
+
+class PasswordServiceBusy(Exception):
+    """Raised when too many hash/verify operations are already queued."""
+
+
+class PasswordService:
+    """
+    Runs Argon2 off the event loop, in a dedicated and bounded thread pool.
+
+    argon2-cffi releases the GIL while hashing, so threads run in
+    parallel. The pool is separate from asyncio's default executor, so a
+    burst of sign-ins can't starve other to_thread work (and vice versa).
+    At most max_pending operations may be running or waiting; beyond that
+    the call fails fast with PasswordServiceBusy instead of piling up
+    requests (and memory: each hash holds memory_cost KiB while it runs).
+    """
+
+    def __init__(self, hasher: PasswordHasher, workers: int = 0, max_pending: int = 64) -> None:
+        self.hasher = hasher
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="argon2")
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            raise PasswordServiceBusy("Too many password operations in progress")
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    def _is_upgrade(self, hashed: str) -> bool:
+        # check_needs_rehash flags any difference; only rewrite a stored hash
+        # if the current parameters are at least as costly for an attacker.
+        # Parallelism is left out: fewer lanes don't lower the total work.
+        current = self.hasher
+        try:
+            stored = extract_parameters(hashed)
+        except InvalidHashError:
+            return False
+        return (
+            current.time_cost >= stored.time_cost
+            and current.memory_cost >= stored.memory_cost
+            and current.hash_len >= stored.hash_len
+            and current.salt_len >= stored.salt_len
+        )
+
+    def _verify(self, hashed: str, secret: str) -> tuple:
+        # verify + check_needs_rehash + rehash in a single trip to the pool
+        try:
+            self.hasher.verify(hashed, secret)
+        except (VerificationError, InvalidHashError):
+            return False, None
+        if self.hasher.check_needs_rehash(hashed) and self._is_upgrade(hashed):
+            return True, self.hasher.hash(secret)
+        return True, None
+
+    async def hash(self, secret: str) -> str:
+        """
+        Hashes a secret with Argon2 in the pool.
+
+        Args:
+            secret: The (already peppered) password.
+
+        Raises:
+            PasswordServiceBusy: If the queue is full.
+
+        Returns:
+            str: The encoded Argon2 hash.
+        """
+        return await self._run(self.hasher.hash, secret)
+
+    async def verify(self, hashed: str, secret: str) -> tuple[bool, str | None]:
+        """
+        Verifies a secret against an Argon2 hash in the pool.
+
+        Args:
+            hashed: The stored Argon2 hash.
+            secret: The (already peppered) password.
+
+        Raises:
+            PasswordServiceBusy: If the queue is full.
+
+        Returns:
+            tuple: (matches, new_hash). new_hash is set when the password
+            matches and the stored hash uses weaker parameters than the
+            current ones (a stronger stored hash is never downgraded).
+        """
+        return await self._run(self._verify, hashed, secret)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
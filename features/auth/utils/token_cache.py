@@ -0,0 +1,152 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from redis.exceptions import RedisError
+
+from .token_codec import canonical_token
+
+logger = logging.getLogger(__name__)
+
+
+def _blacklist_key(signed: bytes) -> str:
+    return f"blacklist:{hashlib.sha256(signed).hexdigest()}"
+
+
+def blacklist_key(token: str) -> str:
+    """
+    Redis key that marks a token as revoked.
+
+    Keyed on the decoded header and payload (what the signature covers),
+    so every encoding of the same token, and any other valid signature
+    over the same claims, maps to the same key.
+
+    Args:
+        token: The encoded JWT.
+
+    Raises:
+        ValueError: If the token is malformed.
+
+    Returns:
+        str: blacklist:{sha256 hex}.
+    """
+    header, payload, _ = canonical_token(token)
+    return _blacklist_key(header + b"." + payload)
+
+
+class _Entry:
+    __slots__ = ("claims", "exp", "blacklist_key", "checked_until", "revoked")
+
+    def __init__(self, claims: dict, exp: float, blacklist_key: str) -> None:
+        self.claims = claims
+        self.exp = exp
+        self.blacklist_key = blacklist_key
+        self.checked_until = 0.0
+        self.revoked = False
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of already verified JWTs, keyed by the SHA-256 of the
+    decoded token bytes (see canonical_token), not of the raw string.
+
+    The signature is verified once per token. After that the claims are
+    served from memory until the token's exp. Revocation
+    (blacklist_key(token) in Redis, written by blacklist_token) is checked
+    on the request path too, but the "not revoked" answer is cached
+    locally for blacklist_check_seconds. A token revoked in another
+    worker is therefore rejected here within that delay. A token revoked
+    in this worker is rejected immediately (see revoke).
+    """
+
+    def __init__(
+        self,
+        decode: Callable[[str], dict],
+        redis,
+        max_size: int = 10_000,
+        blacklist_check_seconds: float = 5.0,
+    ) -> None:
+        self._decode = decode
+        self._redis = redis
+        self.max_size = max_size
+        self.blacklist_check_seconds = blacklist_check_seconds
+        self._entries: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def _keys(token: str) -> tuple[bytes, str]:
+        header, payload, signature = canonical_token(token)
+        signed = header + b"." + payload
+        key = hashlib.sha256(signed + b"." + signature).digest()
+        return key, _blacklist_key(signed)
+
+    def _entry(self, token: str, now: float) -> Optional[_Entry]:
+        key, revocation_key = self._keys(token)
+        entry = self._entries.get(key)
+        if entry is not None and entry.exp > now:
+            self._entries.move_to_end(key)
+            return entry
+
+        # cache miss or expired: verify signature and claims (raises ValueError)
+        claims = self._decode(token)
+        exp = claims.get("exp")
+        if not isinstance(exp, (int, float)):
+            # without exp there is no safe lifetime for the entry: don't cache
+            self._entries.pop(key, None)
+            return _Entry(claims, now, revocation_key)
+
+        entry = self._entries[key] = _Entry(claims, exp, revocation_key)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return entry
+
+    async def verify(self, token: str) -> dict:
+        """
+        Returns the claims of a valid, non revoked token.
+
+        Args:
+            token: The encoded JWT.
+
+        Raises:
+            ValueError: If the token is invalid, expired or revoked.
+
+        Returns:
+            dict: The decoded claims (shared with the cache: do not mutate).
+        """
+        now = time.time()
+        entry = self._entry(token, now)
+
+        if entry.revoked:
+            raise ValueError("Token revoked")
+
+        if entry.checked_until <= now:
+            try:
+                revoked = await self._redis.exists(entry.blacklist_key)
+            except RedisError as e:
+                # same policy as the rate limiter: Redis down doesn't block requests
+                logger.warning(f"Token blacklist unavailable: {e}")
+                return entry.claims
+            if revoked:
+                entry.revoked = True
+                raise ValueError("Token revoked")
+            entry.checked_until = now + self.blacklist_check_seconds
+
+        return entry.claims
+
+    def revoke(self, token: str) -> None:
+        """
+        Marks a token as revoked in this worker without waiting for the
+        next blacklist check.
+
+        Args:
+            token: The encoded JWT (any encoding of it).
+        """
+        try:
+            key, _ = self._keys(token)
+        except ValueError:
+            return
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry.revoked = True
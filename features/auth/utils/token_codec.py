@@ -0,0 +1,253 @@
+import base64
+import hashlib
+import hmac
+import time
+
+import orjson
+from jose import jwt as _jose_jwt, JWTError
+
+try:
+    import jwt as _pyjwt
+except ImportError:
+    _pyjwt = None
+
+try:
+    from joserfc import jwt as _joserfc_jwt
+    from joserfc.errors import JoseError
+    from joserfc.jwk import OctKey
+except ImportError:
+    _joserfc_jwt = None
+
+_HMAC_DIGESTS = {
+    "HS256": hashlib.sha256,
+    "HS384": hashlib.sha384,
+    "HS512": hashlib.sha512,
+}
+
+BACKENDS = ("auto", "native", "pyjwt", "joserfc", "jose")
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+def _validate_claims(claims, now: float | None = None) -> dict:
+    """Same time checks as python-jose: exp (expired) and nbf (not yet valid)."""
+    if not isinstance(claims, dict):
+        raise ValueError("Invalid token")
+    now = time.time() if now is None else now
+
+    exp = claims.get("exp")
+    if exp is not None and (not isinstance(exp, (int, float)) or exp < now):
+        raise ValueError("Invalid token")
+
+    nbf = claims.get("nbf")
+    if nbf is not None and (not isinstance(nbf, (int, float)) or nbf > now):
+        raise ValueError("Invalid token")
+    return claims
+
+
+def canonical_token(token: str) -> tuple[bytes, bytes, bytes]:
+    """
+    Decoded header, payload and signature of a JWT.
+
+    base64url decoders (ours and python-jose's) accept several spellings
+    of the same bytes (padding, stray characters, unused trailing bits),
+    so anything keyed on a token (cache, blacklist) must use these bytes
+    and never the raw string.
+
+    Args:
+        token: The encoded JWT.
+
+    Raises:
+        ValueError: If the token is malformed.
+
+    Returns:
+        tuple: (header, payload, signature) as raw bytes.
+    """
+    try:
+        segments = token.encode("ascii").split(b".")
+        if len(segments) != 3:
+            raise ValueError("Invalid token")
+        header, payload, signature = (_b64decode(segment) for segment in segments)
+    except Exception:
+        raise ValueError("Invalid token")
+    return header, payload, signature
+
+
+def unverified_claims(token: str) -> dict:
+    """
+    Reads the claims of a JWT without verifying it (e.g. to know its exp).
+
+    Args:
+        token: The encoded JWT.
+
+    Raises:
+        ValueError: If the token is malformed.
+
+    Returns:
+        dict: The token claims.
+    """
+    try:
+        claims = orjson.loads(_b64decode(token.encode("ascii").split(b".")[1]))
+    except Exception:
+        raise ValueError("Invalid token")
+    if not isinstance(claims, dict):
+        raise ValueError("Invalid token")
+    return claims
+
+
+class HMACTokenCodec:
+    """
+    HS256/384/512 on top of hmac/hashlib. The key is prepared once (an
+    hmac object that is copied on every sign/verify) and the header of
+    our own tokens is precomputed.
+    """
+
+    name = "native"
+
+    def __init__(self, secret: str, algorithm: str) -> None:
+        self.algorithm = algorithm
+        self._mac = hmac.new(secret.encode("utf-8"), digestmod=_HMAC_DIGESTS[algorithm])
+        # same bytes python-jose produces, so tokens it issued skip the header parse
+        self._header = _b64encode(orjson.dumps({"alg": algorithm, "typ": "JWT"}))
+
+    def _sign(self, signing_input: bytes) -> bytes:
+        mac = self._mac.copy()
+        mac.update(signing_input)
+        return mac.digest()
+
+    def encode(self, claims: dict) -> str:
+        signing_input = self._header + b"." + _b64encode(orjson.dumps(claims))
+        return (signing_input + b"." + _b64encode(self._sign(signing_input))).decode("ascii")
+
+    def decode(self, token: str) -> dict:
+        try:
+            signing_input, _, signature = token.encode("ascii").rpartition(b".")
+            header, _, payload = signing_input.partition(b".")
+            if header != self._header and orjson.loads(_b64decode(header)).get("alg") != self.algorithm:
+                raise ValueError("Invalid token")
+            # canonical encoding only: the received segment must match byte for byte
+            if not hmac.compare_digest(signature, _b64encode(self._sign(signing_input))):
+                raise ValueError("Invalid token")
+            claims = orjson.loads(_b64decode(payload))
+        except Exception:
+            raise ValueError("Invalid token")
+        return _validate_claims(claims)
+
+
+class PyJWTCodec:
+    name = "pyjwt"
+
+    def __init__(self, secret: str, algorithm: str) -> None:
+        if _pyjwt is None:
+            raise RuntimeError("PyJWT is not installed")
+        self.algorithm = algorithm
+        self._algorithms = [algorithm]
+        self._jwt = _pyjwt.PyJWT()
+        self._key = secret
+
+    def encode(self, claims: dict) -> str:
+        return self._jwt.encode(claims, self._key, algorithm=self.algorithm)
+
+    def decode(self, token: str) -> dict:
+        try:
+            return self._jwt.decode(token, self._key, algorithms=self._algorithms)
+        except _pyjwt.PyJWTError:
+            raise ValueError("Invalid token")
+
+
+class JoserfcCodec:
+    name = "joserfc"
+
+    def __init__(self, secret: str, algorithm: str) -> None:
+        if _joserfc_jwt is None:
+            raise RuntimeError("joserfc is not installed")
+        self.algorithm = algorithm
+        self._algorithms = [algorithm]
+        self._header = {"alg": algorithm, "typ": "JWT"}
+        self._key = OctKey.import_key(secret)
+        self._registry = _joserfc_jwt.JWTClaimsRegistry()
+
+    def encode(self, claims: dict) -> str:
+        return _joserfc_jwt.encode(self._header, claims, self._key, algorithms=self._algorithms)
+
+    def decode(self, token: str) -> dict:
+        try:
+            claims = _joserfc_jwt.decode(token, self._key, algorithms=self._algorithms).claims
+            self._registry.validate(claims)
+        except (JoseError, ValueError):
+            raise ValueError("Invalid token")
+        return claims
+
+
+class JoseCodec:
+    """python-jose, the original implementation (any algorithm it supports)."""
+
+    name = "jose"
+
+    def __init__(self, secret: str, algorithm: str) -> None:
+        self.algorithm = algorithm
+        self._algorithms = [algorithm]
+        self._key = secret
+
+    def encode(self, claims: dict) -> str:
+        return _jose_jwt.encode(claims, self._key, algorithm=self.algorithm)
+
+    def decode(self, token: str) -> dict:
+        try:
+            return _jose_jwt.decode(token, self._key, algorithms=self._algorithms)
+        except JWTError:
+            raise ValueError("Invalid token")
+
+
+class UnconfiguredTokenCodec:
+    """Stand-in when JWT_SECRET_KEY/ALGORITHM are missing: fails on use, not on import."""
+
+    name = "unconfigured"
+
+    def encode(self, claims: dict) -> str:
+        raise RuntimeError("JWT_SECRET_KEY and ALGORITHM must be configured")
+
+    def decode(self, token: str) -> dict:
+        raise ValueError("Invalid token")
+
+
+def make_token_codec(backend: str, algorithm: str | None, secret: str | None):
+    """
+    Resolves the JWT implementation once (at startup).
+
+    Args:
+        backend: "auto" (native for HS*, python-jose otherwise), "native",
+            "pyjwt", "joserfc" or "jose".
+        algorithm: JWT algorithm (settings.ALGORITHM).
+        secret: Signing key (settings.JWT_SECRET_KEY).
+
+    Raises:
+        ValueError: If the backend is unknown or can't handle the algorithm.
+        RuntimeError: If the optional package for the backend is not installed.
+
+    Returns:
+        A codec with encode(claims) -> str and decode(token) -> dict
+        (decode raises ValueError("Invalid token")).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown JWT backend: {backend}")
+    if not secret or not algorithm:
+        return UnconfiguredTokenCodec()
+
+    if backend == "auto":
+        backend = "native" if algorithm in _HMAC_DIGESTS else "jose"
+    if backend == "native":
+        if algorithm not in _HMAC_DIGESTS:
+            raise ValueError(f"The native JWT backend only supports {', '.join(_HMAC_DIGESTS)}")
+        return HMACTokenCodec(secret, algorithm)
+    if backend == "pyjwt":
+        return PyJWTCodec(secret, algorithm)
+    if backend == "joserfc":
+        return JoserfcCodec(secret, algorithm)
+    return JoseCodec(secret, algorithm)
@@ -2,16 +2,27 @@ from fastapi import HTTPException, Request
 from shared.db.schemas import User, Manager, Crew, Token
 from psqlmodel import Select
 from argon2 import PasswordHasher
-from argon2.exceptions import VerifyMismatchError
 from datetime import timedelta, datetime, timezone
-from jose import jwt, JWTError
 from shared.settings import settings
 from shared.redis.redis_client import redis_client
 import secrets
 import hashlib
 from features.trips.utils import get_locations_by_org_id
+from .token_cache import VerifiedTokenCache, blacklist_key
+from .token_codec import make_token_codec, unverified_claims
+from .password_service import PasswordService, PasswordServiceBusy
 
-ph = PasswordHasher()
+ph = PasswordHasher(
+    time_cost=settings.ARGON2_TIME_COST,
+    memory_cost=settings.ARGON2_MEMORY_COST,
+    parallelism=settings.ARGON2_PARALLELISM,
+)
+
+# Argon2 off the event loop (bounded thread pool)
+passwords = PasswordService(ph, workers=settings.ARGON2_WORKERS, max_pending=settings.ARGON2_MAX_PENDING)
+
+# JWT backend, algorithm and key resolved once at startup
+token_codec = make_token_codec(settings.JWT_BACKEND, settings.ALGORITHM, settings.JWT_SECRET_KEY)
 
 WEBHOOK_SECRET=settings.WEBHOOK_SECRET
 
@@ -100,18 +111,31 @@ async def verify_if_exist(
         raise ValueError("Phone already in use")
 
 
-def hash_pwd(plain) -> str:
+def _password_busy() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Too many requests in progress. Try again later.",
+        headers={"Retry-After": "1"},
+    )
+
+async def hash_pwd(plain) -> str:
 
     """
-    Hashes a plain password using Argon2 and a secret pepper.
+    Hashes a plain password using Argon2 and a secret pepper (in the password pool).
 
     Args:
         plain: The plain text password to hash.
 
+    raises:
+        HTTPException: 503 if the password pool queue is full.
+
     return -> The hashed password string.
     """
 
-    return ph.hash(plain + settings.PEPPER)
+    try:
+        return await passwords.hash(plain + settings.PEPPER)
+    except PasswordServiceBusy:
+        raise _password_busy()
 
 def encode_token(sub: str, 
         metadata: dict | None = None,
@@ -143,7 +167,7 @@ def encode_token(sub: str,
         if metadata:
             payload["metadata"] = metadata
 
-        token = jwt.encode(payload, settings.JWT_SECRET_KEY, algorithm=settings.ALGORITHM)
+        token = token_codec.encode(payload)
         
         return {
             f"{type}_token": token,
@@ -164,11 +188,15 @@ def decode_token(token: str) -> dict:
     return -> The decoded payload as a dictionary.
     """
 
-    try:
-        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.ALGORITHM])
-        return payload 
-    except JWTError:
-        raise ValueError("Invalid token")
+    return token_codec.decode(token)
+
+# verified tokens per worker (used by VerifyToken)
+verified_tokens = VerifiedTokenCache(
+    decode_token,
+    redis_client,
+    max_size=settings.AUTH_TOKEN_CACHE_SIZE,
+    blacklist_check_seconds=settings.AUTH_BLACKLIST_CHECK_SECONDS,
+)
 
 async def get_user_by_email(session, email: str) -> User: 
 
@@ -202,25 +230,24 @@ async def verify_password(session, plain: str, hashed: str,  user_id: str | None
         hashed: The stored Argon2 hashed password.
         user_id: The ID of the user (used for updating the hash if needed).
 
+    raises:
+        HTTPException: 503 if the password pool queue is full.
+
     return -> True if the password is correct, False otherwise.
     """
 
     try:
-        ph.verify(hashed, plain + settings.PEPPER)
-        
-        if ph.check_needs_rehash(hashed):
-            new_hash = ph.hash(plain + settings.PEPPER)
-            
-            if user_id:
-                user = await session.get(User, user_id)
-                user.password_hash = new_hash
-                await session.commit()
-            return True
-        
-        return True  
-        
-    except VerifyMismatchError:
-        return False
+        ok, new_hash = await passwords.verify(hashed, plain + settings.PEPPER)
+    except PasswordServiceBusy:
+        raise _password_busy()
+
+    # stored hash uses outdated parameters: replace it with the current ones
+    if ok and new_hash and user_id:
+        user = await session.get(User, user_id)
+        user.password_hash = new_hash
+        await session.commit()
+
+    return ok
 
 def gen_refresh_token() -> tuple[str, str, datetime]:
     
@@ -439,23 +466,34 @@ def get_token(request):
         raise ValueError("Missing authentication token")
     return token
 
-async def blacklist_token(token: str, exp_seconds: int = 300):
+async def blacklist_token(token: str, exp_seconds: int | None = None):
     """
     Blacklists a JWT token by storing it in Redis with an expiration time.
+    The Redis key is derived from the decoded token (see blacklist_key), so
+    re-encoded variants of the same token are revoked too.
 
     Args:
         token (str): The JWT token to blacklist.
-        exp_seconds (int, optional): Expiration time in seconds for the blacklist entry. Default is 300 seconds.
+        exp_seconds (int, optional): Expiration time in seconds for the blacklist entry. Default is the
+            token's remaining lifetime (300 seconds if it can't be read), so it stays revoked until it expires.
 
     Raises:
-        ValueError: If the token is already blacklisted.
+        ValueError: If the token is malformed or already blacklisted.
 
     Returns:
         None
     """
-    if await redis_client.exists(f"blacklist:{token}"):
+    key = blacklist_key(token)
+    if await redis_client.exists(key):
         raise ValueError("Token revoked")
-    await redis_client.setex(f"blacklist:{token}", exp_seconds, "blacklisted")
+    if exp_seconds is None:
+        try:
+            exp = unverified_claims(token).get("exp")
+            exp_seconds = int(exp - now().timestamp()) + 1
+        except (ValueError, TypeError):
+            exp_seconds = 300
+    await redis_client.setex(key, max(1, exp_seconds), "blacklisted")
+    verified_tokens.revoke(token)
 
 def verify_role(roles: list):
         
@@ -474,14 +512,12 @@ def verify_role(roles: list):
 
     def _dep(request: Request):
         user_data = request.state.user_data
-        print(f"USER DATA: {user_data}")
         if not user_data:
             raise HTTPException(status_code=401, detail="Missing or invalid authentication")
         #
         role = None
         if user_data:
             role = user_data.get("role")
-            print(f"USER ROLE: {role}")
         if not role or role not in roles:
             raise HTTPException(
                 status_code=403,
@@ -9,7 +9,7 @@ from datetime import date, time, timezone
 from zoneinfo import ZoneInfo
 from typing import Optional
 from features.auth.utils import verify_role
-from features.trips.utils import get_locations_by_org_id, tz_from_latlon
+from features.trips.utils import get_locations_by_org_id, tz_from_latlon, location_trips_query
 
 
 
@@ -297,10 +297,6 @@ async def get_trips(
         filters.append(TripDB.airline.ilike(f"%{airline}%"))
     if flight_number:
         filters.append(TripDB.flight_number == flight_number)
-    # ✅ Usar reduce para combinar con &
-    from functools import reduce
-    combined_filter = reduce(lambda a, b: a & b, filters)
-
     # Contar total con los mismos filtros
     """count_stmt = Select(Count(TripDB.id)).From(TripDB).Where(combined_filter)
     total = await session.exec(count_stmt).first()
@@ -321,13 +317,7 @@ async def get_trips(
 
     total_count_col = Count(TripDB.id).Over().As("total_count")
     trips_stmt = (
-        Select(TripDB, total_count_col)  # Seleccionas el modelo Y el total
-        .Where(combined_filter)
-        .OrderBy(
-            TripDB.pick_up_date.Asc(),
-            TripDB.pick_up_time.Asc(),
-            TripDB.id.Asc(),
-        )
+        location_trips_query(filters, total_count_col)  # el modelo Y el total
         .Offset(skip)
         .Limit(limit)
     )
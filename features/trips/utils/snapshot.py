@@ -0,0 +1,166 @@
+"""
+Servicio de snapshot de trips por location.
+
+El cache de Redis (ver shared/redis/trip_cache.py) solo vive TRIP_TTL_SECONDS
+desde el último cambio, así que tras unos minutos sin eventos queda frío o
+parcial. Antes de leerlo verificamos el marcador loc:{id}:trips:warm; si no
+está, cargamos los trips del día desde Postgres y repoblamos Redis en un solo
+pipeline. La carga es single-flight: 1 task por location en el proceso y un
+lock en Redis entre workers, así N reconexiones simultáneas = 1 query.
+"""
+import asyncio
+import logging
+import secrets
+from datetime import datetime
+from typing import Dict
+from zoneinfo import ZoneInfo
+
+import orjson
+from psqlmodel import Select
+
+from shared.db.db_config import engine, AsyncSession
+from shared.db.schemas import Location, Trip
+from shared.redis.redis_client import redis_client as redis
+from shared.redis.trip_cache import cache_trip, touch_location, iter_cached_trips
+from shared.settings import settings
+from features.trips.utils.utils import location_trips_query
+
+logger = logging.getLogger(__name__)
+
+TRIP_TTL_SECONDS = settings.TRIP_TTL_SECONDS
+WARM_LOCK_TTL_MS = 15_000
+WARM_POLL_INTERVAL = 0.05
+
+_inflight: Dict[str, asyncio.Task] = {}
+
+
+def warm_key(location_id: str) -> str:
+    return f"loc:{location_id}:trips:warm"
+
+
+def lock_key(location_id: str) -> str:
+    return f"loc:{location_id}:trips:lock"
+
+
+async def load_location_trips_from_db(location_id: str) -> list:
+    """
+    Trips del día actual (en el timezone de la location), con la misma query
+    y orden que el listado de trips.
+    """
+    async with AsyncSession(engine) as session:
+        location = await session.exec(
+            Select(Location).Where(Location.id == location_id)
+        ).first()
+        if not location:
+            return []
+
+        today = datetime.now(ZoneInfo(location.timezone)).date()
+        rows = await session.exec(
+            location_trips_query([
+                Trip.location_id == location_id,
+                Trip.pick_up_date == today,
+            ])
+        ).all()
+
+    return [row.model_dump(mode="json") for row in rows]
+
+
+async def _repopulate(location_id: str, trips: list) -> None:
+    pipe = redis.pipeline()
+
+    for trip in trips:
+        trip_id = str(trip.get("id") or "").strip()
+        if not trip_id:
+            continue
+        # NX: si el webhook ya escribió una versión más nueva, no la pisamos
+        cache_trip(pipe, location_id, trip_id, orjson.dumps(trip), nx=True)
+
+    touch_location(pipe, location_id)
+    pipe.set(warm_key(location_id), "1", ex=TRIP_TTL_SECONDS)
+    await pipe.execute()
+
+
+async def _wait_until_warm(location_id: str, deadline: float) -> bool:
+    """
+    Espera a que el worker que tiene el lock termine. True si dejó el
+    marcador; False si soltó el lock sin dejarlo (su carga falló) o se
+    venció el plazo.
+    """
+    keys = (warm_key(location_id), lock_key(location_id))
+    loop = asyncio.get_running_loop()
+
+    while loop.time() < deadline:
+        warm, locked = await redis.mget(keys)
+        if warm:
+            return True
+        if not locked:
+            return False
+        await asyncio.sleep(WARM_POLL_INTERVAL)
+    return False
+
+
+async def _warm_location_cache(location_id: str) -> None:
+    token = secrets.token_hex(8)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + WARM_LOCK_TTL_MS / 1000
+
+    while True:
+        acquired = await redis.set(lock_key(location_id), token, nx=True, px=WARM_LOCK_TTL_MS)
+        if acquired:
+            break
+        # otro worker está cargando: esperamos su marcador. Si suelta el
+        # lock sin marcador reintentamos la carga nosotros (dentro del plazo)
+        if await _wait_until_warm(location_id, deadline) or loop.time() >= deadline:
+            return
+
+    try:
+        trips = await load_location_trips_from_db(location_id)
+        await _repopulate(location_id, trips)
+    except Exception as e:
+        # sin Postgres servimos lo que tenga Redis; sin marcador, el
+        # próximo snapshot vuelve a intentar la carga
+        logger.warning("Trip cache warm-up failed for %s: %r", location_id, e)
+    finally:
+        if await redis.get(lock_key(location_id)) == token:
+            await redis.delete(lock_key(location_id))
+
+
+async def ensure_location_cache(location_id: str) -> None:
+    """
+    Garantiza que el cache de la location esté caliente antes de un snapshot.
+    Concurrentes en el mismo proceso comparten la misma carga. Si la carga
+    desde Postgres falla no propaga el error: el snapshot sale de Redis.
+    """
+    if await redis.exists(warm_key(location_id)):
+        return
+
+    task = _inflight.get(location_id)
+    if task is None:
+        task = asyncio.create_task(_warm_location_cache(location_id))
+        _inflight[location_id] = task
+        task.add_done_callback(lambda _t: _inflight.pop(location_id, None))
+
+    await asyncio.shield(task)
+
+
+async def invalidate_location_cache(location_id: str) -> None:
+    """Fuerza la recarga desde Postgres en el próximo snapshot."""
+    await redis.delete(warm_key(location_id))
+
+
+async def iter_location_trips(location_id: str, page_size: int):
+    """
+    Entrega los trips cacheados de la location en páginas de hasta page_size
+    (HSCAN o SSCAN+MGET según el layout, nunca un SMEMBERS/HGETALL gigante).
+    Si el índice apunta a trips expirados (cache parcial) invalida el
+    marcador para que el próximo snapshot recargue desde Postgres.
+    """
+    missing = 0
+
+    async for trips, page_missing in iter_cached_trips(redis, location_id, page_size):
+        missing += page_missing
+        if trips:
+            yield trips
+
+    if missing:
+        await invalidate_location_cache(location_id)
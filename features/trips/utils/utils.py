@@ -1,13 +1,13 @@
 from __future__ import annotations
 from dataclasses import dataclass
 from datetime import datetime, timezone, date, time
-from functools import lru_cache
+from functools import lru_cache, reduce
 from zoneinfo import ZoneInfo
 from timezonefinder import TimezoneFinder
 import json
 from shared.redis.redis_client import redis_client
 from psqlmodel import Select
-from shared.db.schemas import Location
+from shared.db.schemas import Location, Trip
 
 
 async def save_trip_event_to_redis(trip_id: str, event_data: dict):
@@ -39,6 +39,23 @@ async def get_locations_by_org_id(session, org_id):
     ).to_dicts()
     return locations
 
+def location_trips_query(filters: list, *columns):
+    """
+    Listing query for trips: combines the filters with & and orders by
+    pick-up date, pick-up time and id (stable pagination).
+    Extra columns (e.g. a window count) can be selected next to the Trip.
+    """
+    combined_filter = reduce(lambda a, b: a & b, filters)
+    return (
+        Select(Trip, *columns)
+        .Where(combined_filter)
+        .OrderBy(
+            Trip.pick_up_date.Asc(),
+            Trip.pick_up_time.Asc(),
+            Trip.id.Asc(),
+        )
+    )
+
 # ---- Core: timezone lookup (Lat/Lon -> IANA) ----
 
 _tf = TimezoneFinder()
@@ -1,31 +1,104 @@
 from fastapi import WebSocket
 from typing import Dict, Set, Optional, Any
 import asyncio
-import json
+import logging
+import zlib
+
+import orjson
 
 from shared.redis.redis_client import redis_client as redis
+from shared.redis.trip_log import batch_reader, seq_key, TRIP_BUS_MODE
+from shared.events.trip_buffer import TripEventBuffer
+from shared.metrics import (
+    TRIP_BUS_GAPS,
+    WS_CONNECTIONS,
+    WS_FRAMES_SENT,
+    observe_events,
+    observe_origin,
+    oldest_origin,
+)
+from shared.settings import settings
 
+logger = logging.getLogger(__name__)
 
-class WSManager:
+WS_COMPRESSIONS = {"deflate"}
+WS_COMPRESS_MIN_BYTES = settings.WS_COMPRESS_MIN_BYTES
+
+
+def normalize_compression(compression: Optional[str]) -> Optional[str]:
+    compression = str(compression or "").strip().lower()
+    return compression if compression in WS_COMPRESSIONS else None
+
+
+def encode_frame(payload: dict, compression: Optional[str] = None) -> str | bytes:
+    """
+    Serializa un payload una sola vez. Con compression="deflate" y payload
+    grande (>= WS_COMPRESS_MIN_BYTES) retorna bytes zlib -> frame binario.
     """
-    Batch-only pubsub consumer:
-    Redis channel loc:{location_id} debe publicar:
-      {"type":"trips_batch","location_id":"<loc>","events":[ ... ]}
+    data = orjson.dumps(payload)
+    if compression == "deflate" and len(data) >= WS_COMPRESS_MIN_BYTES:
+        return zlib.compress(data)
+    return data.decode("utf-8")
+
+
+async def send_frame(ws: WebSocket, frame: str | bytes) -> None:
+    if isinstance(frame, bytes):
+        await ws.send_bytes(frame)
+    else:
+        await ws.send_text(frame)
+
 
-    Por defecto reenvía a clientes como eventos individuales ("trip_event") por item.
-    Si quieres reenviar como 1 solo mensaje batch al frontend, setea:
-      self.SEND_WS_BATCH = True
+class WSManager:
+    """
+    Batch-only consumer del bus de trips (TRIP_BUS_MODE):
+    el canal loc:{location_id} / stream loc:{location_id}:log debe traer:
+      {"type":"trips_batch","seq":N,"location_id":"<loc>","events":[ ... ]}
+
+    Cada cliente negocia su modo de entrega al conectar (query `batch`/`max_batch`)
+    o con el primer mensaje `subscribe`:
+      - legacy (default): 1 mensaje "trip_event" por item.
+      - batch: 1 mensaje "trips_batch" por mensaje de Redis, partido en frames
+        de como máximo `max_batch` eventos.
+    SEND_WS_BATCH define el modo de los clientes que no negocian nada.
+
+    Los frames llevan el `seq` del batch de Redis (ver shared/redis/trip_log.py).
+    Mientras un socket se sincroniza (snapshot o replay desde `last_seq`) sus
+    eventos en vivo quedan en `pending` y se envían al terminar, en orden.
     """
-    SEND_WS_BATCH = False  # <- ponlo True si quieres mandar 1 msg WS por batch
+    SEND_WS_BATCH = False  # <- modo por defecto para clientes que no negocian
+    MAX_BATCH_EVENTS = 500  # tope de eventos por frame "trips_batch"
+    COALESCE_WINDOW_MS = settings.WS_COALESCE_WINDOW_MS  # 0 = sin coalescing
 
     def __init__(self) -> None:
         self.rooms: Dict[str, Set[WebSocket]] = {}
         self.ws_meta: Dict[WebSocket, dict] = {}
 
         self.location_listener_tasks: Dict[str, asyncio.Task] = {}
+        self.bus_stats: Dict[str, dict] = {}
         self._lock = asyncio.Lock()
 
-    async def connect(self, ws: WebSocket, location_id: str, claims: dict) -> None:
+    def _normalize_delivery(self, batch: Optional[bool], max_batch: Optional[int]) -> dict:
+        if batch is None:
+            batch = self.SEND_WS_BATCH
+        try:
+            max_batch = int(max_batch) if max_batch else self.MAX_BATCH_EVENTS
+        except (TypeError, ValueError):
+            max_batch = self.MAX_BATCH_EVENTS
+        return {
+            "batch": bool(batch),
+            "max_batch": max(1, min(max_batch, self.MAX_BATCH_EVENTS)),
+        }
+
+    async def connect(
+        self,
+        ws: WebSocket,
+        location_id: str,
+        claims: dict,
+        batch: Optional[bool] = None,
+        max_batch: Optional[int] = None,
+        syncing: bool = False,
+        compression: Optional[str] = None,
+    ) -> None:
         await ws.accept()
         async with self._lock:
             metadata = claims.get("metadata") or {}
@@ -35,7 +108,32 @@ class WSManager:
                 "user_id": claims.get("sub"),
                 "role": metadata.get("role"),
                 "org_id": metadata.get("organization_id"),
+                "pending": [] if syncing else None,
+                "compression": normalize_compression(compression),
+                **self._normalize_delivery(batch, max_batch),
             }
+            WS_CONNECTIONS.set(len(self.ws_meta))
+
+    async def set_delivery(
+        self,
+        ws: WebSocket,
+        batch: Optional[bool] = None,
+        max_batch: Optional[int] = None,
+    ) -> dict:
+        """
+        Renegocia el modo de entrega de un socket ya conectado
+        (p. ej. desde el primer mensaje `subscribe`). Retorna el modo efectivo.
+        """
+        async with self._lock:
+            meta = self.ws_meta.get(ws)
+            if not meta:
+                return self._normalize_delivery(batch, max_batch)
+            if batch is None:
+                batch = meta["batch"]
+            if max_batch is None:
+                max_batch = meta["max_batch"]
+            meta.update(self._normalize_delivery(batch, max_batch))
+            return {"batch": meta["batch"], "max_batch": meta["max_batch"]}
 
     async def disconnect(self, ws: WebSocket) -> None:
         task_to_cancel: Optional[asyncio.Task] = None
@@ -44,6 +142,7 @@ class WSManager:
             meta = self.ws_meta.pop(ws, None)
             if not meta:
                 return
+            WS_CONNECTIONS.set(len(self.ws_meta))
 
             loc = meta["location_id"]
             self.rooms.get(loc, set()).discard(ws)
@@ -62,6 +161,14 @@ class WSManager:
         except Exception:
             return False
 
+    async def _safe_send_frame(self, ws: WebSocket, frame: str | bytes) -> bool:
+        try:
+            await send_frame(ws, frame)
+            WS_FRAMES_SENT.inc()
+            return True
+        except Exception:
+            return False
+
     async def route_location_event(self, location_id: str, payload: dict) -> None:
         location_id = str(location_id)
 
@@ -76,6 +183,101 @@ class WSManager:
         for ws in dead:
             await self.disconnect(ws)
 
+    async def finish_sync(self, ws: WebSocket, synced_seq: Optional[int]) -> None:
+        """
+        Termina la sincronización de un socket: envía los eventos en vivo que
+        llegaron mientras tanto con seq > synced_seq y pasa a modo en vivo.
+        """
+        meta = self.ws_meta.get(ws)
+        if not meta:
+            return
+
+        while True:
+            pending = meta["pending"]
+            if not pending:
+                meta["pending"] = None
+                return
+
+            meta["pending"] = []
+            for seq, events in pending:
+                if seq is not None and synced_seq is not None and seq <= synced_seq:
+                    continue
+                if not await self.send_events(ws, meta["location_id"], events, seq):
+                    await self.disconnect(ws)
+                    return
+
+    async def send_events(
+        self,
+        ws: WebSocket,
+        location_id: str,
+        events: list,
+        seq: Optional[int] = None,
+    ) -> bool:
+        """Envía eventos a un solo socket respetando su modo de entrega."""
+        meta = self.ws_meta.get(ws)
+        if not meta:
+            return False
+
+        if meta["batch"]:
+            payloads = self._build_batch_payloads(location_id, events, meta["max_batch"], seq)
+        else:
+            payloads = [self._build_single_payload(location_id, ev, seq) for ev in events]
+
+        for payload in payloads:
+            if not await self._safe_send_frame(ws, encode_frame(payload, meta["compression"])):
+                return False
+        return True
+
+    async def fan_out_events(self, location_id: str, events: list, seq: Optional[int] = None) -> None:
+        """
+        Reenvía los eventos de un mensaje de Redis a cada socket según su modo.
+        Los frames se construyen y serializan una sola vez por modo, no por socket.
+        """
+        location_id = str(location_id)
+
+        async with self._lock:
+            targets = [
+                (ws, self.ws_meta[ws])
+                for ws in self.rooms.get(location_id, set())
+                if ws in self.ws_meta
+            ]
+
+        if not targets:
+            return
+
+        frames_by_mode: Dict[tuple, list] = {}
+        # latencia commit -> socket: 1 muestra por socket con el evento más viejo
+        origin_ts = oldest_origin(events)
+
+        dead = []
+        for ws, meta in targets:
+            if meta["pending"] is not None:
+                # sincronizando: se envía en finish_sync()
+                meta["pending"].append((seq, events))
+                continue
+
+            size = meta["max_batch"] if meta["batch"] else 0
+            mode = (size, meta["compression"])
+            frames = frames_by_mode.get(mode)
+            if frames is None:
+                if size:
+                    payloads = self._build_batch_payloads(location_id, events, size, seq)
+                else:
+                    payloads = [self._build_single_payload(location_id, ev, seq) for ev in events]
+                frames = frames_by_mode[mode] = [
+                    encode_frame(payload, meta["compression"]) for payload in payloads
+                ]
+
+            for frame in frames:
+                if not await self._safe_send_frame(ws, frame):
+                    dead.append(ws)
+                    break
+            else:
+                observe_origin("sent", origin_ts)
+
+        for ws in dead:
+            await self.disconnect(ws)
+
     async def ensure_location_listener(self, location_id: str) -> None:
         async with self._lock:
             if location_id in self.location_listener_tasks:
@@ -88,17 +290,34 @@ class WSManager:
 
     def _decode_pubsub_data(self, data: Any) -> Optional[dict]:
         try:
-            if isinstance(data, (bytes, bytearray)):
-                data = data.decode("utf-8", errors="ignore")
-            if isinstance(data, str):
-                return json.loads(data)
+            if isinstance(data, (bytes, bytearray, str)):
+                return orjson.loads(data)
             if isinstance(data, dict):
                 return data
         except Exception:
             return None
         return None
 
-    async def _dispatch_single(self, location_id: str, ev: dict) -> None:
+    def _build_batch_payloads(
+        self,
+        location_id: str,
+        events: list,
+        max_batch: int,
+        seq: Optional[int] = None,
+    ) -> list:
+        payloads = []
+        for i in range(0, len(events), max_batch):
+            payload = {
+                "type": "trips_batch",
+                "location_id": location_id,
+                "events": events[i : i + max_batch],
+            }
+            if seq is not None:
+                payload["seq"] = seq
+            payloads.append(payload)
+        return payloads
+
+    def _build_single_payload(self, location_id: str, ev: dict, seq: Optional[int] = None) -> dict:
         trip_id = ev.get("trip_id")
         event_type = ev.get("event_type") or ev.get("event") or "db_update"
         trip = ev.get("trip")
@@ -111,61 +330,161 @@ class WSManager:
         }
         if isinstance(trip, dict):
             payload["trip"] = trip
+        if seq is not None:
+            payload["seq"] = seq
 
-        await self.route_location_event(location_id, payload)
+        return payload
 
-    async def _location_listener(self, location_id: str) -> None:
+    def _extract_batch_events(self, location_id: str, ev: Optional[dict]) -> tuple:
+        """Valida un mensaje trips_batch. Retorna (seq | None, eventos)."""
+        if not ev or ev.get("type") != "trips_batch":
+            return None, []
+
+        msg_loc = ev.get("location_id")
+        if msg_loc and str(msg_loc) != str(location_id):
+            return None, []
+
+        events = ev.get("events") or []
+        if not isinstance(events, list):
+            return None, []
+
+        seq = ev.get("seq")
+        if not isinstance(seq, int):
+            seq = None
+
+        return seq, [item for item in events if isinstance(item, dict)]
+
+    async def replay(self, ws: WebSocket, location_id: str, batches: list) -> Optional[int]:
         """
-        Batch-only listener:
-          {"type":"trips_batch","location_id":"<loc>","events":[...]}
+        Reenvía a un socket los batches perdidos (del log de replay),
+        coalescidos en un solo envío. Retorna el último seq enviado.
         """
-        channel = f"loc:{location_id}"
-        pubsub = redis.pubsub()
-        await pubsub.subscribe(channel)
-
-        try:
-            async for msg in pubsub.listen():
-                if msg.get("type") != "message":
-                    continue
+        buffer = TripEventBuffer()
+        last_seq: Optional[int] = None
+        for batch in batches:
+            seq, events = self._extract_batch_events(location_id, batch)
+            buffer.extend(events)
+            if seq is not None:
+                last_seq = seq
+
+        events = buffer.drain()
+        if events and not await self.send_events(ws, location_id, events, last_seq):
+            return None
+        return last_seq
 
-                ev = self._decode_pubsub_data(msg.get("data"))
-                if not ev:
-                    continue
+    async def _location_listener(self, location_id: str) -> None:
+        """
+        Batch-only listener:
+          {"type":"trips_batch","seq":N,"location_id":"<loc>","events":[...]}
 
-                if ev.get("type") != "trips_batch":
-                    continue
+        Lee del bus configurado (pubsub o stream, ver shared/redis/trip_log.py).
+        Si se cae la conexión reintenta con backoff; en modo stream continúa
+        desde su cursor sin perder eventos.
 
-                msg_loc = ev.get("location_id")
-                if msg_loc and str(msg_loc) != str(location_id):
-                    continue
+        Con COALESCE_WINDOW_MS > 0 acumula los eventos de la room durante la
+        ventana y solo reenvía el último estado de cada trip (delete gana).
+        """
+        reader = batch_reader(redis, location_id)
+        # dict propio: un listener anterior de la location puede seguir cerrándose
+        stats = self.bus_stats[location_id] = {"last_seq": None, "gaps": 0, "errors": 0}
 
-                events = ev.get("events") or []
-                if not isinstance(events, list) or not events:
-                    continue
+        loop = asyncio.get_running_loop()
+        window = max(0, self.COALESCE_WINDOW_MS) / 1000
+        buffer = TripEventBuffer()
+        buffer_seq: Optional[int] = None
+        deadline: Optional[float] = None
+        failures = 0
 
-                # Opción 1: reenviar 1 solo mensaje batch por websocket
-                if self.SEND_WS_BATCH:
-                    ws_payload = {
-                        "type": "trips_batch",
-                        "location_id": location_id,
-                        "events": events,
-                    }
-                    await self.route_location_event(location_id, ws_payload)
+        try:
+            await reader.open()
+
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - loop.time())
+                try:
+                    raw_batches = await reader.read(timeout)
+                    failures = 0
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    failures += 1
+                    stats["errors"] += 1
+                    logger.warning("Trip bus read failed for %s: %r", location_id, e)
+                    await asyncio.sleep(min(2 ** failures, 30) * 0.1)
+                    try:
+                        await reader.open()
+                    except Exception:
+                        pass
                     continue
 
-                # Opción 2: reenviar item por item (default)
-                for item in events:
-                    if isinstance(item, dict):
-                        await self._dispatch_single(location_id, item)
+                for raw in raw_batches:
+                    seq, events = self._extract_batch_events(
+                        location_id, self._decode_pubsub_data(raw)
+                    )
+                    if seq is not None:
+                        last = stats["last_seq"]
+                        if last is not None and seq > last + 1:
+                            stats["gaps"] += 1
+                            TRIP_BUS_GAPS.inc()
+                        stats["last_seq"] = seq
+
+                    if not events:
+                        continue
+
+                    observe_events("dispatched", events)
+
+                    if not window:
+                        # sin ventana: batch o item por item según lo que negoció cada cliente
+                        await self.fan_out_events(location_id, events, seq)
+                        continue
+
+                    buffer.extend(events)
+                    if seq is not None:
+                        buffer_seq = seq
+                    if deadline is None:
+                        deadline = loop.time() + window
+
+                if buffer and deadline is not None and loop.time() >= deadline:
+                    deadline = None
+                    flush_seq, buffer_seq = buffer_seq, None
+                    await self.fan_out_events(location_id, buffer.drain(), flush_seq)
 
         except asyncio.CancelledError:
             pass
         finally:
-            try:
-                await pubsub.unsubscribe(channel)
-                await pubsub.close()
-            except Exception:
-                pass
+            # solo si siguen siendo las nuestras (no las de un listener más nuevo)
+            if self.bus_stats.get(location_id) is stats:
+                del self.bus_stats[location_id]
+            await reader.close()
+
+    async def bus_lag(self) -> Dict[str, dict]:
+        """
+        Lag del bus por location escuchada en este proceso:
+        head (último seq asignado) - last_seq (último seq recibido).
+        """
+        locations = list(self.bus_stats.keys())
+        if not locations:
+            return {}
+
+        pipe = redis.pipeline(transaction=False)
+        for location_id in locations:
+            pipe.get(seq_key(location_id))
+        heads = await pipe.execute()
+
+        out = {}
+        for location_id, head in zip(locations, heads):
+            stats = self.bus_stats.get(location_id) or {}
+            head = int(head or 0)
+            last = stats.get("last_seq")
+            out[location_id] = {
+                "mode": TRIP_BUS_MODE,
+                "head_seq": head,
+                "last_seq": last,
+                "lag": max(0, head - last) if last is not None else None,
+                "gaps": stats.get("gaps", 0),
+                "errors": stats.get("errors", 0),
+                "sockets": len(self.rooms.get(location_id, ())),
+            }
+        return out
 
 
 manager = WSManager()
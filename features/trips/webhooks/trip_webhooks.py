@@ -1,115 +1,87 @@
-from fastapi import APIRouter, Request, Header
+from fastapi import APIRouter, Request, Response, Header, HTTPException
 from shared.settings import settings
 from features.auth.utils import verify_webhook_signature
 from shared.redis.redis_client import redis_client as redis
-import json
-from collections import defaultdict
+from shared.redis.trip_ingest import apply_trip_events
+from shared.events.batch_codec import (
+    BatchDecodeError,
+    BatchTooLarge,
+    UnsupportedBatchEncoding,
+    decompress,
+    load_batch,
+    supported_encodings,
+    supported_formats,
+)
 
 WEBHOOK_SECRET = settings.WEBHOOK_SECRET
-TRIP_TTL_SECONDS = 300
+WEBHOOK_MAX_BODY_BYTES = settings.WEBHOOK_MAX_BODY_BYTES
 
-webhook = APIRouter()
-
-def _safe_str(x) -> str:
-    return str(x or "").strip()
-
-def _process_event_into_pipe(event: dict, pipe):
-    """
-    Mete comandos Redis al pipeline según el event_type.
-    Retorna (location_id, pub_event) o None si inválido.
-    """
-    location_id = _safe_str(event.get("location_id"))
-    trip_id = _safe_str(event.get("trip_id"))
-    event_type = _safe_str(event.get("event_type") or event.get("event") or "db_update")
-
-    # El trip puede venir como dict (update/insert) o (delete) también dict con estado anterior
-    trip = event.get("trip")
+# Negociación (RFC 7694 / Accept-Post): qué puede mandar el streaming
+ACCEPT_ENCODING = ", ".join(supported_encodings())
+ACCEPT_POST = ", ".join(supported_formats())
+NEGOTIATION_HEADERS = {"Accept-Encoding": ACCEPT_ENCODING, "Accept-Post": ACCEPT_POST}
 
-    if not location_id or not trip_id:
-        return None
-
-    trip_key = f"trip:{trip_id}"
-    idx_key = f"loc:{location_id}:trips"
-
-    # Si delete: borra cache + srem del índice (en vez de set)
-    if event_type == "delete":
-        pipe.delete(trip_key)
-        pipe.srem(idx_key, trip_id)
-        # mantenemos TTL del índice para que se limpie solo si queda vacío/abandonado
-        pipe.expire(idx_key, TRIP_TTL_SECONDS)
-
-        pub_event = {
-            "location_id": location_id,
-            "trip_id": trip_id,
-            "event_type": "delete",
-        }
-        return location_id, pub_event
+webhook = APIRouter()
 
-    # insert/update: requiere trip dict (mínimo)
-    if not isinstance(trip, dict):
-        return None
 
-    pipe.set(trip_key, json.dumps(trip), ex=TRIP_TTL_SECONDS)
-    pipe.sadd(idx_key, trip_id)
-    pipe.expire(idx_key, TRIP_TTL_SECONDS)
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail="Payload too large", headers=NEGOTIATION_HEADERS)
 
-    pub_event = {
-        "location_id": location_id,
-        "trip_id": trip_id,
-        "event_type": event_type or "db_update",
-        "trip": trip,  # si esto pesa mucho, puedes quitarlo del pubsub
-    }
-    return location_id, pub_event
 
+async def _read_body(request: Request, limit: int) -> bytes:
+    """
+    Lee el body con tope de tamaño: rechaza de entrada por Content-Length y
+    corta el stream apenas lo leído pasa el tope (chunked o Content-Length
+    mentiroso), sin bufferear el resto.
+    """
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > limit:
+        raise _too_large()
+
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise _too_large()
+        chunks.append(chunk)
+    return b"".join(chunks)
 
 @webhook.post("/v1/webhooks/trips/batch")
 async def trips_webhook_batch(
     request: Request,
+    response: Response,
     x_signature: str = Header(default="", alias="x-webhook-secret"),
+    content_encoding: str = Header(default="identity"),
+    content_type: str = Header(default="application/json"),
 ):
-    raw = await request.body()
+    response.headers.update(NEGOTIATION_HEADERS)
+
+    raw = await _read_body(request, WEBHOOK_MAX_BODY_BYTES)
 
-    # Seguridad: firma HMAC sobre TODO el body del batch
+    # Seguridad: firma HMAC sobre TODO el body del batch (los bytes tal
+    # cual llegan, comprimidos): se verifica antes de descomprimir
     if not x_signature or not verify_webhook_signature(raw, x_signature, WEBHOOK_SECRET):
         return {"ok": False, "error": "invalid signature"}
 
-    payload = await request.json()
+    # Un solo parse de los bytes ya verificados (no request.json()),
+    # descomprimiendo con tope de tamaño
+    try:
+        payload = load_batch(decompress(raw, content_encoding, WEBHOOK_MAX_BODY_BYTES), content_type)
+    except BatchTooLarge:
+        raise _too_large()
+    except UnsupportedBatchEncoding as e:
+        raise HTTPException(status_code=415, detail=str(e), headers=NEGOTIATION_HEADERS)
+    except BatchDecodeError:
+        return {"ok": False, "error": "invalid body"}
+
+    if not isinstance(payload, dict):
+        return {"ok": False, "error": "missing events list"}
 
     events = payload.get("events")
     if not isinstance(events, list) or not events:
         return {"ok": False, "error": "missing events list"}
 
-    # 1) Redis pipeline: 1 ejecución para todo el batch
-    pipe = redis.pipeline()
-
-    # 2) Agrupar pubsub por location para publicar menos mensajes
-    by_location = defaultdict(list)
-
-    accepted = 0
-    skipped = 0
-
-    for ev in events:
-        if not isinstance(ev, dict):
-            skipped += 1
-            continue
-
-        out = _process_event_into_pipe(ev, pipe)
-        if not out:
-            skipped += 1
-            continue
-
-        location_id, pub_event = out
-        by_location[location_id].append(pub_event)
-        accepted += 1
-
-    # Ejecuta pipeline (rápido)
-    if accepted:
-        await pipe.execute()
-
-    # 3) Pub/Sub: 1 publish por location (no 1 por evento)
-    #    Si aún quieres menos, puedes publicar 1 solo canal global.
-    for location_id, items in by_location.items():
-        msg = {"type": "trips_batch", "location_id": location_id, "events": items}
-        await redis.publish(f"loc:{location_id}", json.dumps(msg))
-
-    return {"ok": True, "received": len(events), "accepted": accepted, "skipped": skipped}
+    # cache + publish (+ dedup) en Redis: ver shared/redis/trip_ingest.py
+    result = await apply_trip_events(redis, events, payload.get("batch_id"))
+    return {"ok": True, **result}
@@ -1,48 +1,118 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
+from typing import Optional
 from shared.redis.redis_client import redis_client as redis
-from features.trips.utils.ws_manager import manager
-import json
+from features.trips.utils.ws_manager import manager, encode_frame, send_frame, normalize_compression
+from features.trips.utils.snapshot import ensure_location_cache, iter_location_trips
+from shared.redis.trip_log import current_seq, read_log_since
 from shared.db.db_config import engine, AsyncSession
-from features.auth.utils import user_can_access_location, decode_token
+from features.auth.utils import user_can_access_location, verified_tokens, verify_role
+from shared.settings import settings
 
-router = APIRouter()
-
-async def send_snapshot(ws: WebSocket, location_id: str) -> None:
-    idx_key = f"loc:{location_id}:trips"
-    trip_ids = await redis.smembers(idx_key)
+WS_SNAPSHOT_CHUNK_SIZE = settings.WS_SNAPSHOT_CHUNK_SIZE
 
-    if not trip_ids:
-        await ws.send_json({"type": "snapshot", "location_id": location_id, "trips": []})
-        return
-
-    # smembers puede devolver bytes; normalizamos a str
-    norm_ids = []
-    for tid in trip_ids:
-        if isinstance(tid, (bytes, bytearray)):
-            tid = tid.decode("utf-8", errors="ignore")
-        norm_ids.append(str(tid))
-
-    keys = [f"trip:{tid}" for tid in norm_ids]
-    values = await redis.mget(keys)
-
-    trips = []
-    for v in values:
-        if not v:
-            continue
-        if isinstance(v, (bytes, bytearray)):
-            v = v.decode("utf-8", errors="ignore")
-        try:
-            trips.append(json.loads(v))
-        except Exception:
-            continue
+router = APIRouter()
 
-    await ws.send_json({"type": "snapshot", "location_id": location_id, "trips": trips})
+async def send_snapshot(
+    ws: WebSocket,
+    location_id: str,
+    chunk_size: Optional[int] = None,
+    compression: Optional[str] = None,
+) -> int:
+    """
+    Envía el snapshot completo de la location. Retorna el seq del log en el
+    momento de leer el cache (los batches con seq mayor se reenvían después).
+
+    Sin chunk_size: 1 solo mensaje "snapshot" (clientes legacy).
+    Con chunk_size: snapshot_begin -> N x snapshot_chunk -> snapshot_end.
+    Si el cache está frío se recarga antes desde Postgres (ver snapshot.py).
+    """
+    seq = await current_seq(redis, location_id)
+    await ensure_location_cache(location_id)
+    page_size = chunk_size or WS_SNAPSHOT_CHUNK_SIZE
+
+    if not chunk_size:
+        trips = []
+        async for page in iter_location_trips(location_id, page_size):
+            trips.extend(page)
+
+        payload = {"type": "snapshot", "location_id": location_id, "seq": seq, "trips": trips}
+        await send_frame(ws, encode_frame(payload, compression))
+        return seq
+
+    await ws.send_json({
+        "type": "snapshot_begin",
+        "location_id": location_id,
+        "seq": seq,
+        "chunk_size": chunk_size,
+    })
+
+    chunks = 0
+    total = 0
+    async for page in iter_location_trips(location_id, chunk_size):
+        payload = {
+            "type": "snapshot_chunk",
+            "location_id": location_id,
+            "seq": seq,
+            "index": chunks,
+            "trips": page,
+        }
+        await send_frame(ws, encode_frame(payload, compression))
+        chunks += 1
+        total += len(page)
+
+    await ws.send_json({
+        "type": "snapshot_end",
+        "location_id": location_id,
+        "seq": seq,
+        "chunks": chunks,
+        "total": total,
+    })
+    return seq
+
+
+async def resume_or_snapshot(
+    ws: WebSocket,
+    location_id: str,
+    last_seq: Optional[int],
+    chunk_size: Optional[int] = None,
+    compression: Optional[str] = None,
+) -> Optional[int]:
+    """
+    Con last_seq intenta reanudar desde el log de replay (solo eventos perdidos).
+    Si el hueco es muy viejo o el log se reinició, cae a snapshot completo.
+    """
+    if last_seq is not None:
+        batches = await read_log_since(redis, location_id, last_seq)
+        if batches is not None:
+            seq = await manager.replay(ws, location_id, batches)
+            if seq is None:
+                seq = last_seq
+            await ws.send_json({
+                "type": "resumed",
+                "location_id": location_id,
+                "from_seq": last_seq,
+                "seq": seq,
+            })
+            return seq
+
+    return await send_snapshot(ws, location_id, chunk_size, compression)
 
 
 @router.websocket("/ws/trips")
-async def ws_location_trips(ws: WebSocket, location_id: str, token: str):
+async def ws_location_trips(
+    ws: WebSocket,
+    location_id: str,
+    token: str,
+    batch: Optional[bool] = None,
+    max_batch: Optional[int] = None,
+    last_seq: Optional[int] = None,
+    chunked: bool = False,
+    chunk_size: Optional[int] = None,
+    compression: Optional[str] = None,
+):
     try:
-        claims = decode_token(token)
+        # mismo camino que VerifyToken: cache de tokens verificados + blacklist
+        claims = await verified_tokens.verify(token)
     except Exception:
         await ws.close(code=1008)
         return
@@ -59,11 +129,25 @@ async def ws_location_trips(ws: WebSocket, location_id: str, token: str):
             await ws.close(code=1008)
             return
 
-    await manager.connect(ws, location_id, claims)
+    compression = normalize_compression(compression)
+    if chunked or chunk_size:
+        chunk_size = max(1, min(chunk_size or WS_SNAPSHOT_CHUNK_SIZE, WS_SNAPSHOT_CHUNK_SIZE))
+
+    await manager.connect(
+        ws,
+        location_id,
+        claims,
+        batch=batch,
+        max_batch=max_batch,
+        syncing=True,
+        compression=compression,
+    )
     await manager.ensure_location_listener(location_id)
-    await send_snapshot(ws, location_id)
 
     try:
+        synced_seq = await resume_or_snapshot(ws, location_id, last_seq, chunk_size, compression)
+        await manager.finish_sync(ws, synced_seq)
+
         while True:
             msg = await ws.receive_json()
             action = msg.get("action")
@@ -77,7 +161,7 @@ async def ws_location_trips(ws: WebSocket, location_id: str, token: str):
                     return
                 
                 try:
-                    decode_token(ping_token)
+                    await verified_tokens.verify(ping_token)
                     await ws.send_json({"type": "pong"})
                 except Exception:
                     await ws.send_json({"type": "error", "code": 401, "detail": "Invalid or expired token"})
@@ -86,8 +170,18 @@ async def ws_location_trips(ws: WebSocket, location_id: str, token: str):
                 continue
 
             if action == "subscribe":
-                # Suscripción por location - ya está conectado a la room
-                await ws.send_json({"type": "subscribed", "location_id": location_id})
+                # Suscripción por location - ya está conectado a la room.
+                # El cliente puede (re)negociar aquí el modo batch.
+                delivery = await manager.set_delivery(
+                    ws,
+                    batch=msg.get("batch"),
+                    max_batch=msg.get("max_batch"),
+                )
+                await ws.send_json({
+                    "type": "subscribed",
+                    "location_id": location_id,
+                    "delivery": delivery,
+                })
 
             elif action == "unsubscribe":
                 # Desuscripción de la location
@@ -104,3 +198,11 @@ async def ws_location_trips(ws: WebSocket, location_id: str, token: str):
             await ws.close(code=1011)
         except Exception:
             pass
+
+
+@router.get("/v1/trips/bus/lag")
+async def trips_bus_lag(_role=Depends(verify_role(["manager"]))):
+    """
+    Lag del bus de cambios por location escuchada en este worker.
+    """
+    return {"data": await manager.bus_lag()}
@@ -5,6 +5,8 @@ from features.auth.routes.auth_router import router as auth_router
 from features.trips.routes.trips_router import router as trips_router
 from features.trips.websockets.trip_websockets import router as trip_websockets_router
 from features.trips.webhooks.trip_webhooks import webhook as trip_webhooks_router
+from shared.metrics import metrics_router
+from shared.settings import settings
 from features.auth.middlewares.verify_token import VerifyToken
 from shared.middlewares.requests_logger import RequestLoggerMiddleware
 from shared.middlewares.rate_limiter import RateLimitMiddleware
@@ -39,6 +41,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "RateLimit-Policy", "Retry-After"],
 )
 app.add_middleware(DenyDotfileMiddleware)
 
@@ -46,3 +49,6 @@ app.include_router(auth_router)
 app.include_router(trips_router)
 app.include_router(trip_websockets_router)
 app.include_router(trip_webhooks_router)
+# /metrics solo existe con METRICS_TOKEN configurado (ver shared/metrics.py)
+if settings.METRICS_TOKEN:
+    app.include_router(metrics_router)
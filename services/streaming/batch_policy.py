@@ -0,0 +1,80 @@
+"""
+Política adaptativa de batching para el composer del streaming.
+
+  - Tamaño: crece con la profundidad de event_q (el backlog se reparte entre
+    los senders) y con la latencia de los senders (si un envío tarda más que
+    el intervalo de flush, conviene mandar menos batches y más grandes).
+    Siempre entre STREAMING_MIN_BATCH y STREAMING_MAX_BATCH trips.
+  - Bytes: el batch se cierra al llegar a STREAMING_MAX_BATCH_BYTES (tamaño
+    JSON estimado de los eventos agregados; con coalescing sobreestima). El
+    tamaño por evento es una media móvil: solo se serializa 1 de cada
+    EVENT_SIZE_SAMPLE eventos, no todos.
+  - Tiempo: si los senders están libres (batch_q vacía) y no hay más eventos
+    en event_q, se flushea de inmediato; bajo carga se espera hasta
+    STREAMING_FLUSH_INTERVAL_MS para juntar más eventos.
+"""
+import orjson
+
+from shared.settings import settings
+
+# peso de cada muestra nueva en las medias móviles (latencia y tamaño)
+LATENCY_ALPHA = 0.2
+SIZE_ALPHA = 0.2
+# cada cuántos eventos se serializa uno para estimar el tamaño
+EVENT_SIZE_SAMPLE = 32
+
+
+class AdaptiveBatchPolicy:
+    def __init__(
+        self,
+        min_batch: int = settings.STREAMING_MIN_BATCH,
+        max_batch: int = settings.STREAMING_MAX_BATCH,
+        max_bytes: int = settings.STREAMING_MAX_BATCH_BYTES,
+        flush_interval_ms: int = settings.STREAMING_FLUSH_INTERVAL_MS,
+        senders: int = settings.STREAMING_SENDERS,
+    ) -> None:
+        self.min_batch = max(1, min_batch)
+        self.max_batch = max(self.min_batch, max_batch)
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval_ms / 1000
+        self.senders = max(1, senders)
+        # media móvil (EWMA) de la duración de cada envío, en segundos
+        self.send_latency = 0.0
+        # media móvil (EWMA) del tamaño JSON de un evento, en bytes
+        self.event_bytes = 0.0
+        self._until_sample = 0
+
+    def event_size(self, ev: dict) -> int:
+        """Tamaño JSON estimado del evento (muestreado, ver EVENT_SIZE_SAMPLE)."""
+        if self._until_sample:
+            self._until_sample -= 1
+            return int(self.event_bytes)
+
+        self._until_sample = EVENT_SIZE_SAMPLE - 1
+        size = len(orjson.dumps(ev))
+        if not self.event_bytes:
+            self.event_bytes = size
+        else:
+            self.event_bytes += SIZE_ALPHA * (size - self.event_bytes)
+        return size
+
+    def observe_send(self, seconds: float) -> None:
+        if not self.send_latency:
+            self.send_latency = seconds
+            return
+        self.send_latency += LATENCY_ALPHA * (seconds - self.send_latency)
+
+    def target_size(self, queue_depth: int) -> int:
+        want = max(self.min_batch, queue_depth // self.senders)
+
+        if self.flush_interval and self.send_latency > self.flush_interval:
+            want = max(want, int(self.min_batch * self.send_latency / self.flush_interval))
+
+        return min(self.max_batch, want)
+
+    def is_full(self, count: int, nbytes: int, queue_depth: int) -> bool:
+        return count >= self.target_size(queue_depth) or nbytes >= self.max_bytes
+
+    def should_flush_now(self, queue_depth: int, batches_waiting: int) -> bool:
+        """Idle: no queda nada por drenar y ningún batch espera sender."""
+        return queue_depth == 0 and batches_waiting == 0
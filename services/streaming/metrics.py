@@ -0,0 +1,46 @@
+"""
+Métricas Prometheus del servicio de streaming (expuestas en
+STREAMING_METRICS_PORT con el servidor HTTP de prometheus_client).
+"""
+from prometheus_client import Counter, Gauge, Histogram
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+EVENTS_RECEIVED = Counter("streaming_events_received_total", "Trip change events received from Postgres")
+EVENTS_MERGED = Counter("streaming_events_merged_total", "Events coalesced away by the composer")
+
+EVENT_QUEUE_DEPTH = Gauge("streaming_event_queue_depth", "Events waiting in event_q")
+BATCH_QUEUE_DEPTH = Gauge("streaming_batch_queue_depth", "Batches waiting in batch_q")
+SPILL_BYTES = Gauge("streaming_spill_pending_bytes", "Bytes waiting in the disk spill queue")
+
+BATCH_EVENTS = Histogram(
+    "streaming_batch_events",
+    "Events per batch",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2000, 5000),
+)
+BATCH_BYTES = Histogram(
+    "streaming_batch_bytes",
+    "Encoded (and compressed) size of each POST body",
+    buckets=(1_000, 5_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000),
+)
+
+POST_LATENCY = Histogram(
+    "streaming_post_latency_seconds",
+    "Duration of each HTTP POST attempt to the webhook",
+    ["status"],
+    buckets=LATENCY_BUCKETS,
+)
+DELIVERY_LATENCY = Histogram(
+    "streaming_batch_delivery_seconds",
+    "Time to deliver a batch including retries",
+    ["sink", "result"],
+    buckets=LATENCY_BUCKETS,
+)
+SEND_RETRIES = Counter("streaming_send_retries_total", "Batch delivery retries", ["sink"])
+SEND_FAILURES = Counter("streaming_send_failures_total", "Batches not delivered", ["sink", "result"])
+SPILLED_BATCHES = Counter("streaming_spilled_batches_total", "Batches written to the disk spill queue")
+DEAD_LETTERS = Counter("streaming_dead_letter_batches_total", "Batches written to the dead-letter queue")
+SPILL_CORRUPT_RECORDS = Counter(
+    "streaming_spill_corrupt_records_total",
+    "Damaged spill queue records skipped by the replayer (moved to a .corrupt file)",
+)
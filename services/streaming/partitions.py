@@ -0,0 +1,176 @@
+"""
+Reparto de locations entre réplicas del streaming (STREAMING_PARTITIONS > 0).
+
+Todas las réplicas reciben todos los NOTIFY de Postgres; cada una procesa
+solo las particiones que posee:
+
+  partición = blake2b(location_id) mod STREAMING_PARTITIONS
+  dueño     = rendezvous hashing (HRW) de la partición sobre las réplicas
+              vivas: al entrar/salir una réplica solo se mueven ~P/N particiones
+
+Coordinación en Redis:
+
+  streaming:members         ZSET réplica -> vence_en_ms (heartbeat)
+  streaming:lease:{p}       réplica dueña, SET NX PX (renovada cada ~ttl/3)
+
+Handoff ordenado de una partición A -> B:
+  1. A deja de enrutar eventos de p y espera que su lane entregue todo lo
+     que ya tenía (barrier en las colas) antes de borrar el lease.
+  2. B toma el lease recién cuando está libre y reenvía los eventos recientes
+     de p que vio mientras no era dueña (los eventos traen el estado completo
+     del trip: repetir en orden es idempotente; el último estado gana).
+Si A muere sin soltar, el lease vence a los lease_ms y B lo toma igual.
+"""
+import asyncio
+import hashlib
+import time
+from typing import Awaitable, Callable, Optional
+
+MEMBERS_KEY = "streaming:members"
+
+# renueva (1 llamada para todos) solo los leases que siguen siendo nuestros
+_RENEW_LUA = """
+local out = {}
+for i = 1, #KEYS do
+  if redis.call('GET', KEYS[i]) == ARGV[1] then
+    out[i] = redis.call('PEXPIRE', KEYS[i], ARGV[2])
+  else
+    out[i] = 0
+  end
+end
+return out
+"""
+
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def lease_key(partition: int) -> str:
+    return f"streaming:lease:{partition}"
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def partition_of(location_id: str, partitions: int) -> int:
+    return _hash64(str(location_id)) % partitions
+
+
+def rendezvous_owner(partition: int, members: list) -> Optional[str]:
+    if not members:
+        return None
+    return max(members, key=lambda m: _hash64(f"{m}:{partition}"))
+
+
+class PartitionOwnership:
+    def __init__(
+        self,
+        redis,
+        replica_id: str,
+        partitions: int,
+        lease_ms: int,
+        on_acquire: Callable[[int], None],
+        on_release: Callable[[int], Awaitable[None]],
+    ) -> None:
+        self.redis = redis
+        self.replica_id = replica_id
+        self.partitions = partitions
+        self.lease_ms = lease_ms
+        self.on_acquire = on_acquire
+        self.on_release = on_release
+        self.owned: set = set()
+        self.releasing: set = set()
+        self._release_tasks: set = set()
+        self._renew = redis.register_script(_RENEW_LUA)
+        self._release = redis.register_script(_RELEASE_LUA)
+
+    def owns(self, partition: int) -> bool:
+        return partition in self.owned
+
+    async def live_members(self) -> list:
+        now_ms = int(time.time() * 1000)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zadd(MEMBERS_KEY, {self.replica_id: now_ms + self.lease_ms})
+        pipe.zremrangebyscore(MEMBERS_KEY, "-inf", now_ms)
+        pipe.zrange(MEMBERS_KEY, 0, -1)
+        *_, members = await pipe.execute()
+        return [m.decode() if isinstance(m, bytes) else m for m in members]
+
+    def _start_release(self, partition: int) -> None:
+        # 1) sin más eventos nuevos para p en esta réplica (el lease se sigue
+        #    renovando mientras drena, en segundo plano para no frenar el tick)
+        self.owned.discard(partition)
+        self.releasing.add(partition)
+        task = asyncio.create_task(self._release_partition(partition))
+        self._release_tasks.add(task)
+        task.add_done_callback(self._release_tasks.discard)
+
+    async def _release_partition(self, partition: int) -> None:
+        try:
+            # 2) entregar lo que ya estaba en la lane (con timeout = lease)
+            try:
+                await asyncio.wait_for(self.on_release(partition), self.lease_ms / 1000)
+            except asyncio.TimeoutError:
+                print("[PART] drain timeout partition=", partition, flush=True)
+            # 3) recién ahora otra réplica puede tomarla
+            await self._release(keys=[lease_key(partition)], args=[self.replica_id])
+        finally:
+            self.releasing.discard(partition)
+
+    async def tick(self) -> None:
+        members = await self.live_members()
+        desired = {
+            p for p in range(self.partitions)
+            if rendezvous_owner(p, members) == self.replica_id
+        }
+
+        # renovar lo propio (incluido lo que está drenando); si un lease se
+        # perdió (expiró y otro lo tomó) dejamos de enrutar esa partición ya
+        # y drenamos su lane como en un release (el DEL final no borra un
+        # lease ajeno), sin volver a pedirla hasta que termine
+        held = sorted(self.owned | self.releasing)
+        if held:
+            renewed = await self._renew(keys=[lease_key(p) for p in held], args=[self.replica_id, self.lease_ms])
+            for p, ok in zip(held, renewed):
+                if not ok and p in self.owned:
+                    print("[PART] lease lost partition=", p, flush=True)
+                    self._start_release(p)
+
+        for p in sorted(self.owned - desired):
+            self._start_release(p)
+
+        to_acquire = sorted(desired - self.owned - self.releasing)
+        if to_acquire:
+            pipe = self.redis.pipeline(transaction=False)
+            for p in to_acquire:
+                pipe.set(lease_key(p), self.replica_id, nx=True, px=self.lease_ms)
+            for p, ok in zip(to_acquire, await pipe.execute()):
+                if ok:
+                    # sincrónico: el replay de recientes y el alta quedan atómicos
+                    self.on_acquire(p)
+                    self.owned.add(p)
+
+    async def run(self) -> None:
+        interval = self.lease_ms / 3000
+        print("[PART] replica=", self.replica_id, "partitions=", self.partitions, flush=True)
+        while True:
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[PART] tick error={repr(e)}", flush=True)
+            await asyncio.sleep(interval)
+
+    async def stop(self) -> None:
+        """Suelta todo ordenadamente (drain + release) y sale del grupo."""
+        for p in sorted(self.owned):
+            self._start_release(p)
+        if self._release_tasks:
+            await asyncio.gather(*self._release_tasks, return_exceptions=True)
+        await self.redis.zrem(MEMBERS_KEY, self.replica_id)
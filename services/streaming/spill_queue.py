@@ -0,0 +1,260 @@
+"""
+Cola en disco (append-only) para el streaming.
+
+Cuando el backend no responde los batches no se pierden ni llenan la RAM:
+se escriben en segmentos append-only y se reenvían en orden cuando vuelve.
+
+    {dir}/000000000001.seg   registros [len u32][crc32 u32][batch json]
+    {dir}/000000000002.seg   (rotación al pasar segment_bytes)
+    {dir}/offset             {"segment": n, "pos": p} del próximo a enviar
+
+Garantías:
+  - Cada append hace fsync (configurable): un batch aceptado sobrevive a un crash.
+  - El offset se escribe con tmp + fsync + rename (atómico). Se avanza recién
+    después de entregar el batch: entrega at-least-once (el webhook deduplica
+    por batch_id/event_id).
+  - Un registro cortado por un crash a mitad de escritura (cola del último
+    segmento) se detecta por largo/crc y se trunca al abrir.
+  - Un registro dañado en medio de la cola (crc o JSON inválido) no frena el
+    replay: los bytes hasta el próximo registro válido se mueven a
+    {dir}/<segmento>.corrupt y se avisa por on_corrupt.
+  - Los segmentos ya consumidos se borran.
+
+Es sincrónica (I/O de archivos); desde asyncio usar asyncio.to_thread.
+"""
+import json
+import os
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import Callable, Optional
+
+import orjson
+
+_HEADER = struct.Struct(">II")
+
+
+class SpillQueue:
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 64 * 1024 * 1024,
+        fsync: bool = True,
+        on_corrupt: Optional[Callable[[int, int, int], None]] = None,
+    ) -> None:
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        # on_corrupt(segment, pos, skipped_bytes), llamado desde el thread de peek
+        self.on_corrupt = on_corrupt
+        self._lock = threading.Lock()
+
+        segments = self._segments()
+        if not segments:
+            segments = [1]
+            self._segment_path(1).touch()
+
+        self._read_seg, self._read_pos = self._load_offset()
+        if self._read_seg not in segments:
+            # offset viejo (segmento ya borrado) o inexistente
+            self._read_seg, self._read_pos = segments[0], 0
+
+        # segmentos anteriores al offset ya se entregaron
+        for seg in segments:
+            if seg < self._read_seg:
+                self._segment_path(seg).unlink(missing_ok=True)
+
+        self._write_seg = segments[-1]
+        self._write_pos = self._recover_tail(self._write_seg)
+        if self._read_seg == self._write_seg and self._read_pos > self._write_pos:
+            self._read_pos = self._write_pos
+        self._writer = open(self._segment_path(self._write_seg), "ab")
+
+    # ----------------- paths / offset -----------------
+
+    def _segment_path(self, seg: int) -> Path:
+        return self.dir / f"{seg:012d}.seg"
+
+    def _segments(self) -> list:
+        return sorted(int(p.stem) for p in self.dir.glob("*.seg") if p.stem.isdigit())
+
+    def _load_offset(self) -> tuple:
+        try:
+            data = json.loads((self.dir / "offset").read_text())
+            return int(data["segment"]), int(data["pos"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0, 0
+
+    def _save_offset(self) -> None:
+        tmp = self.dir / "offset.tmp"
+        with open(tmp, "w") as f:
+            f.write(json.dumps({"segment": self._read_seg, "pos": self._read_pos}))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, self.dir / "offset")
+        self._fsync_dir()
+
+    def _fsync_dir(self) -> None:
+        if not self.fsync:
+            return
+        fd = os.open(self.dir, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    # ----------------- records -----------------
+
+    @staticmethod
+    def _read_record(f, pos: int) -> Optional[tuple]:
+        """Retorna (payload, next_pos) o None si no hay un registro completo y válido."""
+        f.seek(pos)
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return None
+        length, crc = _HEADER.unpack(header)
+        payload = f.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return None
+        return payload, pos + _HEADER.size + length
+
+    @staticmethod
+    def _find_next_record(data: bytes) -> int:
+        """
+        Primer offset > 0 de data donde empieza un registro válido (crc ok);
+        len(data) si no hay ninguno. Los payloads son objetos JSON, así que
+        solo se prueba el crc donde el payload empieza con "{".
+        """
+        pos = data.find(b"{", 1 + _HEADER.size)
+        while pos != -1:
+            start = pos - _HEADER.size
+            length, crc = _HEADER.unpack_from(data, start)
+            if pos + length <= len(data) and zlib.crc32(data[pos:pos + length]) == crc:
+                return start
+            pos = data.find(b"{", pos + 1)
+        return len(data)
+
+    def _skip_corrupt(self, end: int) -> None:
+        """Mueve a .corrupt los bytes dañados desde el offset de lectura."""
+        seg, pos = self._read_seg, self._read_pos
+        with open(self._segment_path(seg), "rb") as f:
+            f.seek(pos)
+            data = f.read(end - pos)
+        skip = self._find_next_record(data)
+
+        with open(self.dir / f"{seg:012d}.corrupt", "ab") as f:
+            f.write(data[:skip])
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+        self._read_pos = pos + skip
+        self._save_offset()
+        if self.on_corrupt is not None:
+            self.on_corrupt(seg, pos, skip)
+
+    def _recover_tail(self, seg: int) -> int:
+        """
+        Recorre el segmento y trunca un registro final incompleto. Un
+        registro dañado seguido de registros válidos no es la cola: se deja
+        para que peek lo saltee.
+        """
+        path = self._segment_path(seg)
+        data = path.read_bytes()
+        pos = 0
+        while pos < len(data):
+            if pos + _HEADER.size <= len(data):
+                length, crc = _HEADER.unpack_from(data, pos)
+                end = pos + _HEADER.size + length
+                if end <= len(data) and zlib.crc32(data[pos + _HEADER.size:end]) == crc:
+                    pos = end
+                    continue
+            skip = self._find_next_record(data[pos:])
+            if pos + skip >= len(data):
+                break
+            pos += skip
+        if len(data) != pos:
+            with open(path, "r+b") as f:
+                f.truncate(pos)
+        return pos
+
+    def _roll(self) -> None:
+        self._writer.close()
+        self._write_seg += 1
+        self._write_pos = 0
+        self._writer = open(self._segment_path(self._write_seg), "ab")
+        self._fsync_dir()
+
+    # ----------------- API -----------------
+
+    def append(self, batch: dict) -> None:
+        payload = orjson.dumps(batch)
+        record = _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+        with self._lock:
+            if self._write_pos and self._write_pos + len(record) > self.segment_bytes:
+                self._roll()
+            self._writer.write(record)
+            self._writer.flush()
+            if self.fsync:
+                os.fsync(self._writer.fileno())
+            self._write_pos += len(record)
+
+    def peek(self) -> Optional[tuple]:
+        """
+        Próximo batch sin consumirlo: (batch, token) o None si está vacía.
+        Después de entregarlo llamar commit(token).
+        """
+        with self._lock:
+            while (self._read_seg, self._read_pos) != (self._write_seg, self._write_pos):
+                path = self._segment_path(self._read_seg)
+                with open(path, "rb") as f:
+                    rec = self._read_record(f, self._read_pos)
+                end = self._write_pos if self._read_seg == self._write_seg else path.stat().st_size
+
+                if rec is None and self._read_pos >= end:
+                    if self._read_seg >= self._write_seg:
+                        return None
+                    # fin de un segmento viejo: pasamos al siguiente y lo borramos
+                    done = self._read_seg
+                    self._read_seg, self._read_pos = done + 1, 0
+                    self._save_offset()
+                    self._segment_path(done).unlink(missing_ok=True)
+                    continue
+
+                if rec is not None:
+                    payload, next_pos = rec
+                    try:
+                        return orjson.loads(payload), (self._read_seg, next_pos)
+                    except orjson.JSONDecodeError:
+                        pass
+
+                # registro dañado antes del final: lo salteamos y seguimos
+                self._skip_corrupt(end)
+
+            return None
+
+    def commit(self, token: tuple) -> None:
+        with self._lock:
+            self._read_seg, self._read_pos = token
+            self._save_offset()
+
+    def empty(self) -> bool:
+        with self._lock:
+            return (self._read_seg, self._read_pos) == (self._write_seg, self._write_pos)
+
+    def pending_bytes(self) -> int:
+        with self._lock:
+            total = 0
+            for seg in range(self._read_seg, self._write_seg + 1):
+                path = self._segment_path(seg)
+                if path.exists():
+                    total += path.stat().st_size
+            return total - self._read_pos
+
+    def close(self) -> None:
+        with self._lock:
+            self._writer.close()
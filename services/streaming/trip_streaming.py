@@ -1,19 +1,43 @@
 from shared.db.schemas import Trip
 from psqlmodel import create_async_engine, Subscribe
 from shared.settings import settings
+from shared.redis.redis_client import redis_client
+from shared.redis.trip_ingest import apply_trip_events
+from shared.events.trip_buffer import TripEventBuffer
+from services.streaming.batch_policy import AdaptiveBatchPolicy
+from services.streaming.spill_queue import SpillQueue
+from services.streaming.partitions import PartitionOwnership, partition_of
+from shared.events.batch_codec import JSON, MSGPACK, compress, dump_batch
+from services.streaming import metrics
+from prometheus_client import start_http_server
 
 import httpx
+import orjson
 import asyncio
 import uuid
-import json
 import time
 import hmac
 import hashlib
 import random
+import socket
 from asyncio import QueueEmpty
+from collections import deque
 
 SECRET = settings.WEBHOOK_SECRET
 WEBHOOK_BATCH_URL = f"{settings.BACKEND_URL}/v1/webhooks/trips/batch"
+# "http": POST firmado al webhook | "redis": escribe cache + publish directo
+STREAMING_SINK = settings.STREAMING_SINK
+# identidad de la réplica para leases/spill. Con particiones es obligatoria
+# y estable (nombra el dir del spill: un contenedor recreado debe retomar su
+# spill); sin particiones solo se usa en logs
+REPLICA_ID = settings.STREAMING_REPLICA_ID or socket.gethostname()
+# sin particionado igual repartimos locations entre lanes con este módulo
+LOCAL_PARTITIONS = 1024
+
+# Resultado de entregar un batch
+DELIVERED = "delivered"
+REJECTED = "rejected"  # 4xx duro: no tiene sentido reintentar -> dead-letter
+FAILED = "failed"      # reintentos agotados (backend caído) -> spill a disco
 
 # ----------------- SIGNING -----------------
 
@@ -24,6 +48,42 @@ def sign_body(secret: str, body: bytes, ts: int) -> str:
 
 # ----------------- EVENT BUILD -----------------
 
+# Postgres sube updated_at en cada UPDATE (el ORM solo lo pone al insertar):
+# sin esto A->B, B->A, A->B repite old/new y por lo tanto el event_id.
+# Advisory lock: varias réplicas arrancando a la vez no chocan en el DDL
+UPDATED_AT_TRIGGER_SQL = """
+DO $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('trips.trips_touch_updated_at'));
+
+    CREATE OR REPLACE FUNCTION trips.trips_touch_updated_at() RETURNS trigger AS $fn$
+    BEGIN
+        NEW.updated_at := clock_timestamp();
+        RETURN NEW;
+    END;
+    $fn$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE TRIGGER trips_touch_updated_at
+        BEFORE UPDATE ON trips.trips
+        FOR EACH ROW EXECUTE FUNCTION trips.trips_touch_updated_at();
+END
+$$;
+"""
+
+async def ensure_updated_at_trigger(engine) -> None:
+    await engine.execute_raw_async(UPDATED_AT_TRIGGER_SQL)
+
+def source_event_id(event_type, old: dict, new: dict) -> str:
+    """
+    Id determinístico del cambio: hash de la operación y de las imágenes
+    old/new de la fila. new.updated_at lo pone el trigger de
+    UPDATED_AT_TRIGGER_SQL con clock_timestamp() en cada UPDATE, así que
+    dos cambios distintos nunca comparten id (aunque dejen la fila igual);
+    solo se repite si llega dos veces el mismo NOTIFY.
+    """
+    source = orjson.dumps([event_type, old, new], option=orjson.OPT_SORT_KEYS, default=str)
+    return str(uuid.UUID(bytes=hashlib.blake2b(source, digest_size=16).digest()))
+
 def build_event(payload: dict) -> dict | None:
     # payload esperado: {"event": "...", "old": {...}, "new": {...}}
     event_type = payload.get("event")
@@ -36,29 +96,84 @@ def build_event(payload: dict) -> dict | None:
         return None
 
     return {
-        "event_id": str(uuid.uuid4()),
+        # derivado del cambio de origen (no uuid4): todas las réplicas reciben
+        # el mismo NOTIFY, así el replay de un handoff trae el mismo event_id
+        # y el webhook lo deduplica
+        "event_id": source_event_id(event_type, old, new),
+        # epoch del cambio: base de trip_pipeline_latency_seconds en la API
+        "origin_ts": time.time(),
         "event_type": event_type,  # "insert" | "update" | "delete"
         "trip_id": trip_id,
         "location_id": location_id,
         "trip": old if event_type == "delete" else new,
     }
 
+# ----------------- HTTP BODY (FORMATO / COMPRESIÓN) -----------------
+
+# Lo que el webhook anunció que acepta (headers Accept-Post / Accept-Encoding
+# de sus respuestas). Hasta la primera respuesta se manda JSON sin comprimir.
+_peer = {"formats": {JSON}, "encodings": {"identity"}}
+
+def _learn_peer(resp: httpx.Response) -> None:
+    accept_post = resp.headers.get("accept-post")
+    accept_encoding = resp.headers.get("accept-encoding")
+    if accept_post:
+        _peer["formats"] = {v.strip().lower() for v in accept_post.split(",")}
+    if accept_encoding:
+        _peer["encodings"] = {v.strip().lower() for v in accept_encoding.split(",")}
+
+def encode_body(batch: dict) -> tuple[bytes, dict]:
+    """
+    Body + headers del POST según STREAMING_BATCH_FORMAT/ENCODING, si el
+    webhook los soporta. La firma se calcula después, sobre estos bytes.
+    """
+    content_type = MSGPACK if settings.STREAMING_BATCH_FORMAT == "msgpack" else JSON
+    if content_type not in _peer["formats"]:
+        content_type = JSON
+
+    encoding = settings.STREAMING_BATCH_ENCODING
+    if encoding not in _peer["encodings"]:
+        encoding = "identity"
+
+    body = compress(dump_batch(batch, content_type), encoding)
+    headers = {"Content-Type": content_type}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return body, headers
+
 # ----------------- HTTP POST (RETRY) -----------------
 
-async def post_batch_with_retry(client: httpx.AsyncClient, batch: dict, max_retries: int = 8) -> bool:
-    body = json.dumps(batch, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+async def post_batch_with_retry(client: httpx.AsyncClient, batch: dict, max_retries: int = 8) -> str:
+    body, base_headers = encode_body(batch)
+    metrics.BATCH_BYTES.observe(len(body))
 
     for attempt in range(max_retries + 1):
+        if attempt:
+            metrics.SEND_RETRIES.labels("http").inc()
         ts = int(time.time())
         signature = sign_body(SECRET, body, ts)
-        headers = {"Content-Type": "application/json", "x-webhook-secret": signature}
+        headers = {**base_headers, "x-webhook-secret": signature}
 
         try:
-            resp = await client.post(WEBHOOK_BATCH_URL, content=body, headers=headers)
-            print("[HTTP]", resp.status_code, "events=", len(batch["events"]), flush=True)
+            started = time.monotonic()
+            try:
+                resp = await client.post(WEBHOOK_BATCH_URL, content=body, headers=headers)
+            except Exception:
+                metrics.POST_LATENCY.labels("error").observe(time.monotonic() - started)
+                raise
+            metrics.POST_LATENCY.labels(f"{resp.status_code // 100}xx").observe(time.monotonic() - started)
+            print("[HTTP]", resp.status_code, "events=", len(batch["events"]), "bytes=", len(body), flush=True)
+            _learn_peer(resp)
 
             if 200 <= resp.status_code < 300:
-                return True
+                return DELIVERED
+
+            if resp.status_code == 415:
+                # el webhook no soporta este formato/encoding: re-negociar
+                fallback = encode_body(batch)
+                if fallback[1] != base_headers:
+                    body, base_headers = fallback
+                    continue
 
             if resp.status_code in (408, 425, 429, 500, 502, 503, 504):
                 ra = resp.headers.get("retry-after")
@@ -76,128 +191,399 @@ async def post_batch_with_retry(client: httpx.AsyncClient, batch: dict, max_retr
 
             # No reintentar 4xx duros
             print("Batch non-retryable:", resp.status_code, resp.text[:300], flush=True)
-            return False
+            return REJECTED
 
         except Exception as e:
             print(f"[HTTP] attempt={attempt} error={repr(e)}", flush=True)
             if attempt >= max_retries:
-                print("Batch failed permanently:", "batch_id=", batch.get("batch_id"), flush=True)
-                return False
+                print("Batch failed:", "batch_id=", batch.get("batch_id"), flush=True)
+                return FAILED
+            backoff = min(2 ** attempt, 20) + random.random()
+            await asyncio.sleep(backoff)
+
+# ----------------- REDIS SINK (RETRY) -----------------
+
+async def write_batch_with_retry(redis, batch: dict, max_retries: int = 8) -> str:
+    """
+    Sink directo: aplica el batch en Redis con la misma lógica del webhook
+    (shared/redis/trip_ingest.py), sin JSON encode, HMAC, POST ni decode.
+    """
+    for attempt in range(max_retries + 1):
+        if attempt:
+            metrics.SEND_RETRIES.labels("redis").inc()
+        try:
+            result = await apply_trip_events(redis, batch["events"], batch.get("batch_id"))
+            print("[REDIS] events=", len(batch["events"]), "accepted=", result["accepted"], flush=True)
+            return DELIVERED
+
+        except Exception as e:
+            print(f"[REDIS] attempt={attempt} error={repr(e)}", flush=True)
+            if attempt >= max_retries:
+                print("Batch failed:", "batch_id=", batch.get("batch_id"), flush=True)
+                return FAILED
             backoff = min(2 ** attempt, 20) + random.random()
             await asyncio.sleep(backoff)
 
+# ----------------- SPILL (DISCO) -----------------
+
+class Spill:
+    """
+    Overflow + replay en disco (queue) y dead-letter (dead).
+    Mientras queue tenga batches (active) todo batch nuevo va detrás en el
+    disco, así el replay no se adelanta ni se desordena.
+    """
+
+    def __init__(self, queue: SpillQueue, dead: SpillQueue) -> None:
+        self.queue = queue
+        self.dead = dead
+        self.drained = asyncio.Event()
+        self.wakeup = asyncio.Event()
+        if queue.empty():
+            self.drained.set()
+        else:
+            self.wakeup.set()
+
+    @property
+    def active(self) -> bool:
+        return not self.drained.is_set()
+
+    async def put(self, batch: dict) -> None:
+        await asyncio.to_thread(self.queue.append, batch)
+        self.drained.clear()
+        self.wakeup.set()
+        metrics.SPILLED_BATCHES.inc()
+        print("[SPILL] batch_id=", batch.get("batch_id"), "events=", len(batch["events"]), flush=True)
+
+    async def dead_letter(self, batch: dict) -> None:
+        await asyncio.to_thread(self.dead.append, batch)
+        metrics.DEAD_LETTERS.inc()
+        print("[DEAD] batch_id=", batch.get("batch_id"), flush=True)
+
+def on_spill_corrupt(segment: int, pos: int, skipped: int) -> None:
+    # corre en el thread de peek (asyncio.to_thread)
+    metrics.SPILL_CORRUPT_RECORDS.inc()
+    print(f"[SPILL] corrupt record skipped segment={segment} pos={pos} bytes={skipped}", flush=True)
+
+async def deliver(client: httpx.AsyncClient, redis, batch: dict) -> str:
+    sink = "redis" if redis is not None else "http"
+    started = time.monotonic()
+    if redis is not None:
+        result = await write_batch_with_retry(redis, batch)
+    else:
+        result = await post_batch_with_retry(client, batch)
+
+    metrics.DELIVERY_LATENCY.labels(sink, result).observe(time.monotonic() - started)
+    if result != DELIVERED:
+        metrics.SEND_FAILURES.labels(sink, result).inc()
+    return result
+
+async def replayer(spill: Spill, client: httpx.AsyncClient, redis=None):
+    """
+    Reenvía en orden (1 solo task) lo que quedó en disco. El offset avanza
+    solo tras entregar; si el backend sigue caído espera y reintenta el mismo.
+    """
+    print("[REPLAY] started pending_bytes=", spill.queue.pending_bytes(), flush=True)
+    backoff = 1.0
+    while True:
+        item = await asyncio.to_thread(spill.queue.peek)
+        if item is None:
+            spill.drained.set()
+            # un put pudo terminar mientras hacíamos peek
+            if not spill.queue.empty():
+                spill.drained.clear()
+                continue
+            spill.wakeup.clear()
+            await spill.wakeup.wait()
+            continue
+
+        batch, token = item
+        result = await deliver(client, redis, batch)
+        if result == FAILED:
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+            continue
+
+        if result == REJECTED:
+            await spill.dead_letter(batch)
+
+        await asyncio.to_thread(spill.queue.commit, token)
+        backoff = 1.0
+
+# ----------------- LANES -----------------
+
+class Barrier:
+    """
+    Marca que recorre event_q -> composer -> batch_q -> sender: cuando el
+    sender la procesa, todo lo encolado antes en la lane ya se entregó (o
+    quedó en el spill). Se usa para drenar una partición antes de soltarla.
+    """
+
+    __slots__ = ("future",)
+
+    def __init__(self) -> None:
+        self.future = asyncio.get_running_loop().create_future()
+
+    def done(self) -> None:
+        if not self.future.done():
+            self.future.set_result(None)
+
+class Lane:
+    """
+    Cola + composer + 1 sender. Cada location cae siempre en la misma lane
+    (por partición), así sus batches salen en orden.
+    """
+
+    def __init__(self, index: int, event_maxsize: int, batch_maxsize: int) -> None:
+        self.index = index
+        self.event_q: asyncio.Queue = asyncio.Queue(maxsize=event_maxsize)
+        self.batch_q: asyncio.Queue = asyncio.Queue(maxsize=batch_maxsize)
+        self.policy = AdaptiveBatchPolicy(senders=1)
+
+    async def drain(self) -> None:
+        barrier = Barrier()
+        await self.event_q.put(barrier)
+        await barrier.future
+
 # ----------------- COMPOSER (EVENT_Q -> BATCH_Q) -----------------
 
-async def composer(event_q: asyncio.Queue, batch_q: asyncio.Queue):
+def make_batch(events: list[dict]) -> dict:
+    return {
+        "batch_id": str(uuid.uuid4()),
+        "sent_at": int(time.time()),
+        "source": "trips-subscriber",
+        "events": events,
+    }
+
+async def composer(
+    event_q: asyncio.Queue,
+    batch_q: asyncio.Queue,
+    policy: AdaptiveBatchPolicy | None = None,
+):
     """
-    - Drena rápido event_q (get_nowait) hasta MAX_BATCH.
-    - Flush por tamaño o por tiempo.
+    - Drena rápido event_q (get_nowait) hasta el tamaño objetivo del batch.
+    - Coalesce por trip_id dentro del batch (TripEventBuffer): varios updates
+      del mismo trip en un intervalo de flush viajan como 1 solo evento.
+    - Tamaño/bytes/intervalo adaptativos (ver batch_policy.py): batches
+      grandes con backlog, flush inmediato cuando está ocioso.
+    - Todo batch pasa por batch_q (back-pressure si está llena): el sender
+      es el único que escribe al spill, así el disco queda en el orden de
+      batch_q y el replay no se desordena.
+    - Una Barrier fuerza el flush y sigue a batch_q detrás del batch.
     - NUNCA hace busy-loop (si no hay trabajo, hace await).
     """
-    MAX_BATCH = 100
-    FLUSH_INTERVAL = 0.2
+    policy = policy or AdaptiveBatchPolicy()
 
-    buffer: list[dict] = []
+    buffer = TripEventBuffer()
+    barriers: list[Barrier] = []
+    nbytes = 0
     last_flush = time.monotonic()
+    merged_at_flush = 0
 
     print("[COMPOSER] started", flush=True)
 
+    def add(ev) -> None:
+        nonlocal nbytes
+        if isinstance(ev, Barrier):
+            barriers.append(ev)
+        else:
+            buffer.add(ev)
+            nbytes += policy.event_size(ev)
+        event_q.task_done()
+
     while True:
-        # 1) Drena lo que haya sin bloquear
-        while len(buffer) < MAX_BATCH:
+        # 1) Drena lo que haya sin bloquear (hasta una barrier)
+        while not barriers and not policy.is_full(len(buffer), nbytes, event_q.qsize()):
             try:
                 ev = event_q.get_nowait()
             except QueueEmpty:
                 break
-            buffer.append(ev)
-            event_q.task_done()
-
-        # 2) Flush inmediato por tamaño
-        if len(buffer) >= MAX_BATCH:
-            batch = {
-                "batch_id": str(uuid.uuid4()),
-                "sent_at": int(time.time()),
-                "source": "trips-subscriber",
-                "events": buffer,
-            }
-            buffer = []
-            last_flush = time.monotonic()
-            await batch_q.put(batch)
-            print("[BATCH] queued size=100 batch_q=", batch_q.qsize(), flush=True)
+            add(ev)
+
+        if barriers and not buffer:
+            for barrier in barriers:
+                await batch_q.put(barrier)
+            barriers.clear()
             continue
 
-        # 3) Flush por tiempo
-        if buffer and (time.monotonic() - last_flush) >= FLUSH_INTERVAL:
-            batch = {
-                "batch_id": str(uuid.uuid4()),
-                "sent_at": int(time.time()),
-                "source": "trips-subscriber",
-                "events": buffer,
-            }
-            size = len(buffer)
-            buffer = []
+        # 2) Flush inmediato por tamaño/bytes, por ocio, por tiempo o por barrier
+        if buffer and (
+            barriers
+            or policy.is_full(len(buffer), nbytes, event_q.qsize())
+            or policy.should_flush_now(event_q.qsize(), batch_q.qsize())
+            or (time.monotonic() - last_flush) >= policy.flush_interval
+        ):
+            batch = make_batch(buffer.drain())
+            merged = buffer.merged - merged_at_flush
+            merged_at_flush = buffer.merged
+            metrics.BATCH_EVENTS.observe(len(batch["events"]))
+            metrics.EVENTS_MERGED.inc(merged)
+            size_bytes = nbytes
+            nbytes = 0
             last_flush = time.monotonic()
             await batch_q.put(batch)
-            print("[BATCH] queued size=", size, "batch_q=", batch_q.qsize(), flush=True)
+            print(
+                "[BATCH] queued size=", len(batch["events"]), "bytes~", size_bytes, "merged=", merged,
+                "merged_total=", buffer.merged, "received_total=", buffer.received,
+                "batch_q=", batch_q.qsize(), flush=True,
+            )
             continue
 
-        # 4) Si no hay nada, espera un evento (cede el event loop)
+        # 3) Si no hay nada, espera un evento (cede el event loop)
         if not buffer:
             ev = await event_q.get()
-            buffer.append(ev)
-            event_q.task_done()
+            # el intervalo de flush cuenta desde el primer evento del batch
+            last_flush = time.monotonic()
+            add(ev)
             continue
 
-        # 5) Si hay buffer, espera o próximo evento o el timeout para flush
-        remaining = max(0.0, FLUSH_INTERVAL - (time.monotonic() - last_flush))
+        # 4) Si hay buffer, espera o próximo evento o el timeout para flush
+        remaining = max(0.0, policy.flush_interval - (time.monotonic() - last_flush))
         try:
             ev = await asyncio.wait_for(event_q.get(), timeout=remaining)
-            buffer.append(ev)
-            event_q.task_done()
+            add(ev)
         except asyncio.TimeoutError:
             # próximo loop flushea
             pass
 
-# ----------------- SENDER (BATCH_Q -> HTTP) -----------------
+# ----------------- SENDER (BATCH_Q -> HTTP | REDIS) -----------------
 
-async def sender(batch_q: asyncio.Queue, client: httpx.AsyncClient):
-    print("[SENDER] started", flush=True)
+async def sender(
+    batch_q: asyncio.Queue,
+    client: httpx.AsyncClient,
+    redis=None,
+    policy: AdaptiveBatchPolicy | None = None,
+    spill: Spill | None = None,
+):
+    print("[SENDER] started sink=", "redis" if redis is not None else "http", flush=True)
     while True:
         batch = await batch_q.get()
+        if isinstance(batch, Barrier):
+            batch.done()
+            batch_q.task_done()
+            continue
+
+        started = time.monotonic()
         try:
-            await post_batch_with_retry(client, batch)
+            if spill is not None and spill.active:
+                # hay replay en curso: va detrás de lo que está en disco
+                await spill.put(batch)
+                continue
+
+            result = await deliver(client, redis, batch)
+
+            if result == FAILED and spill is not None:
+                await spill.put(batch)
+            elif result == REJECTED and spill is not None:
+                await spill.dead_letter(batch)
+            elif result != DELIVERED:
+                print("Batch failed permanently:", "batch_id=", batch.get("batch_id"), flush=True)
         finally:
+            if policy is not None:
+                policy.observe_send(time.monotonic() - started)
             batch_q.task_done()
 
 # ----------------- HEARTBEAT (OPTIONAL) -----------------
 
-async def heartbeat(event_q: asyncio.Queue, batch_q: asyncio.Queue):
+async def heartbeat(lanes: list[Lane], spill: Spill | None = None, ownership: PartitionOwnership | None = None):
     while True:
-        print(f"[HB] event_q={event_q.qsize()} batch_q={batch_q.qsize()}", flush=True)
+        spilled = await asyncio.to_thread(spill.queue.pending_bytes) if spill is not None else 0
+        event_depth = sum(lane.event_q.qsize() for lane in lanes)
+        batch_depth = sum(lane.batch_q.qsize() for lane in lanes)
+        metrics.EVENT_QUEUE_DEPTH.set(event_depth)
+        metrics.BATCH_QUEUE_DEPTH.set(batch_depth)
+        metrics.SPILL_BYTES.set(spilled)
+        owned = f" partitions={len(ownership.owned)}" if ownership is not None else ""
+        print(f"[HB] event_q={event_depth} batch_q={batch_depth} spill_bytes={spilled}{owned}", flush=True)
         await asyncio.sleep(1)
 
 # ----------------- MAIN -----------------
 
 async def main():
-    print("[BOOT] WEBHOOK_BATCH_URL =", WEBHOOK_BATCH_URL, flush=True)
-    print("[BOOT] SECRET length =", (len(SECRET) if SECRET else 0), flush=True)
+    print("[BOOT] STREAMING_SINK =", STREAMING_SINK, flush=True)
+
+    start_http_server(settings.STREAMING_METRICS_PORT)
+    print("[BOOT] metrics on :", settings.STREAMING_METRICS_PORT, flush=True)
+
+    redis = None
+    if STREAMING_SINK == "redis":
+        redis = redis_client
+    elif STREAMING_SINK == "http":
+        print("[BOOT] WEBHOOK_BATCH_URL =", WEBHOOK_BATCH_URL, flush=True)
+        print("[BOOT] SECRET length =", (len(SECRET) if SECRET else 0), flush=True)
 
-    if not SECRET:
-        raise RuntimeError("Invalid WEBHOOK_SECRET.")
+        if not SECRET:
+            raise RuntimeError("Invalid WEBHOOK_SECRET.")
+    else:
+        raise RuntimeError(f"Invalid STREAMING_SINK: {STREAMING_SINK}")
 
-    # Cola de eventos individuales (rápida)
-    event_q: asyncio.Queue = asyncio.Queue(maxsize=200_000)
+    if settings.STREAMING_PARTITIONS and not settings.STREAMING_REPLICA_ID:
+        # el hostname cambia al recrear el contenedor y su spill quedaría huérfano
+        raise RuntimeError("STREAMING_REPLICA_ID is required when STREAMING_PARTITIONS is set.")
 
-    # Cola de batches listos (control de memoria / ritmo)
-    batch_q: asyncio.Queue = asyncio.Queue(maxsize=2_000)
+    # Lanes: cola de eventos (rápida) + cola de batches (control de memoria /
+    # ritmo) + 1 sender cada una; la partición de la location elige la lane
+    n_lanes = max(1, settings.STREAMING_SENDERS)
+    lanes = [Lane(i, 200_000 // n_lanes, 2_000 // n_lanes or 1) for i in range(n_lanes)]
+    partitions = settings.STREAMING_PARTITIONS or LOCAL_PARTITIONS
+
+    def lane_for(partition: int) -> Lane:
+        return lanes[partition % n_lanes]
 
     limits = httpx.Limits(max_connections=10, max_keepalive_connections=10)
     timeout = httpx.Timeout(30.0, connect=5.0)
 
+    # Overflow/replay y dead-letter en disco (segmentos append-only), 1 dir por réplica
+    spill_dir = settings.STREAMING_SPILL_DIR
+    if settings.STREAMING_PARTITIONS:
+        spill_dir = f"{spill_dir}/{REPLICA_ID}"
+    spill = Spill(
+        SpillQueue(
+            f"{spill_dir}/queue",
+            settings.STREAMING_SPILL_SEGMENT_BYTES,
+            settings.STREAMING_SPILL_FSYNC,
+            on_corrupt=on_spill_corrupt,
+        ),
+        SpillQueue(f"{spill_dir}/dead", settings.STREAMING_SPILL_SEGMENT_BYTES, settings.STREAMING_SPILL_FSYNC),
+    )
+
+    # Modo particionado: solo las particiones con lease propio; lo demás se
+    # guarda un rato (recent) para reenviarlo si heredamos la partición
+    ownership = None
+    recent: deque = deque(maxlen=settings.STREAMING_HANDOFF_BUFFER)
+    recent_window = 2 * settings.STREAMING_LEASE_MS / 1000
+
+    def on_acquire(partition: int) -> None:
+        cutoff = time.monotonic() - recent_window
+        replay = [ev for ts, p, ev in recent if p == partition and ts >= cutoff]
+        lane = lane_for(partition)
+        for ev in replay:
+            try:
+                lane.event_q.put_nowait(ev)
+            except asyncio.QueueFull:
+                print("[PART] handoff replay overflow partition=", partition, flush=True)
+                break
+        print("[PART] acquired partition=", partition, "replayed=", len(replay), flush=True)
+
+    async def on_release(partition: int) -> None:
+        await lane_for(partition).drain()
+        # lo que haya quedado en disco también va antes que el nuevo dueño
+        await spill.drained.wait()
+        print("[PART] released partition=", partition, flush=True)
+
+    if settings.STREAMING_PARTITIONS:
+        ownership = PartitionOwnership(
+            redis_client, REPLICA_ID, partitions, settings.STREAMING_LEASE_MS, on_acquire, on_release
+        )
+
     async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
-        composer_task = asyncio.create_task(composer(event_q, batch_q))
-        sender_tasks = [asyncio.create_task(sender(batch_q, client)) for _ in range(3)]
-        hb_task = asyncio.create_task(heartbeat(event_q, batch_q))
+        tasks = []
+        for lane in lanes:
+            tasks.append(asyncio.create_task(composer(lane.event_q, lane.batch_q, lane.policy)))
+            tasks.append(asyncio.create_task(sender(lane.batch_q, client, redis, lane.policy, spill)))
+        tasks.append(asyncio.create_task(replayer(spill, client, redis)))
+        tasks.append(asyncio.create_task(heartbeat(lanes, spill, ownership)))
+        if ownership is not None:
+            ownership_task = asyncio.create_task(ownership.run())
 
         async_engine = create_async_engine(
             username=settings.POSTGRES_USER,
@@ -210,10 +596,19 @@ async def main():
             pool_close_timeout=10.0,  # Timeout para cierre del pool
         )
 
+        # antes de suscribirse: ningún cambio sale sin updated_at propio
+        await ensure_updated_at_trigger(async_engine)
+
         async def on_trip_change(payload):
             ev = build_event(payload)
-            if ev:
-                await event_q.put(ev)
+            if not ev:
+                return
+            partition = partition_of(ev["location_id"], partitions)
+            if ownership is not None and not ownership.owns(partition):
+                recent.append((time.monotonic(), partition, ev))
+                return
+            metrics.EVENTS_RECEIVED.inc()
+            await lane_for(partition).event_q.put(ev)
 
         sub = Subscribe.engine(async_engine, use_engine_pool=False)
 
@@ -232,15 +627,21 @@ async def main():
             except Exception:
                 pass
 
-            # 3. Drenar colas antes de salir
-            await event_q.join()
-            await batch_q.join()
-
-            # 4. Cancelar todas las tasks
-            all_tasks = [composer_task, *sender_tasks, hb_task]
-            for t in all_tasks:
+            # 3. Drenar colas antes de salir (y soltar las particiones en orden)
+            if ownership is not None:
+                ownership_task.cancel()
+                await asyncio.gather(ownership_task, return_exceptions=True)
+                await ownership.stop()
+            for lane in lanes:
+                await lane.event_q.join()
+                await lane.batch_q.join()
+
+            # 4. Cancelar todas las tasks (lo pendiente en disco se reenvía al arrancar)
+            for t in tasks:
                 t.cancel()
-            await asyncio.gather(*all_tasks, return_exceptions=True)
+            await asyncio.gather(*tasks, return_exceptions=True)
+            spill.queue.close()
+            spill.dead.close()
 
 if __name__ == "__main__":
     # Recomendado: ejecuta con `python -u script.py` para prints inmediatos
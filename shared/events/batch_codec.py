@@ -0,0 +1,140 @@
+"""
+Codificación de los batches streaming -> webhook.
+
+  - Formato (Content-Type): application/json (orjson) o application/msgpack
+    (binario compacto, opcional: requiere el paquete msgpack).
+  - Compresión (Content-Encoding): identity, gzip o zstd. zstd usa
+    compression.zstd de la stdlib (Python 3.14+) o el paquete zstandard.
+
+La firma HMAC se calcula sobre los bytes que viajan (ya comprimidos): el
+webhook verifica antes de descomprimir, y descomprime con un tope de tamaño
+para que un body chico no pueda expandirse a cientos de MB.
+"""
+import zlib
+
+import orjson
+
+try:
+    from compression import zstd as _zstd  # Python 3.14+
+except ImportError:
+    _zstd = None
+
+try:
+    import zstandard as _zstandard
+except ImportError:
+    _zstandard = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+GZIP_LEVEL = 5
+ZSTD_LEVEL = 3
+
+
+class BatchDecodeError(ValueError):
+    pass
+
+
+class BatchTooLarge(BatchDecodeError):
+    pass
+
+
+class UnsupportedBatchEncoding(BatchDecodeError):
+    pass
+
+
+def supported_formats() -> list:
+    return [JSON, MSGPACK] if msgpack is not None else [JSON]
+
+
+def supported_encodings() -> list:
+    encodings = ["identity", "gzip"]
+    if _zstd is not None or _zstandard is not None:
+        encodings.append("zstd")
+    return encodings
+
+
+def _media_type(content_type: str | None) -> str:
+    media = (content_type or JSON).split(";", 1)[0].strip().lower()
+    return MSGPACK if media in (MSGPACK, "application/x-msgpack") else media
+
+
+# ----------------- FORMATO -----------------
+
+def dump_batch(batch: dict, content_type: str = JSON) -> bytes:
+    if _media_type(content_type) == MSGPACK:
+        if msgpack is None:
+            raise RuntimeError("msgpack is not installed")
+        return msgpack.packb(batch, use_bin_type=True)
+    return orjson.dumps(batch)
+
+
+def load_batch(body: bytes, content_type: str | None = None):
+    media = _media_type(content_type)
+    try:
+        if media == MSGPACK:
+            if msgpack is None:
+                raise UnsupportedBatchEncoding("unsupported content type")
+            return msgpack.unpackb(body, raw=False)
+        return orjson.loads(body)
+    except BatchDecodeError:
+        raise
+    except Exception as e:
+        raise BatchDecodeError("invalid body") from e
+
+
+# ----------------- COMPRESIÓN -----------------
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return c.compress(body) + c.flush()
+    if encoding == "zstd":
+        if _zstd is not None:
+            return _zstd.compress(body, level=ZSTD_LEVEL)
+        if _zstandard is not None:
+            return _zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+        raise RuntimeError("zstd is not available")
+    return body
+
+
+def decompress(body: bytes, encoding: str | None, max_size: int) -> bytes:
+    """
+    Descomprime según Content-Encoding sin producir más de max_size bytes.
+    Lanza BatchTooLarge si el resultado lo supera, UnsupportedBatchEncoding
+    si el encoding no se soporta y BatchDecodeError si los datos están
+    corruptos.
+    """
+    encoding = (encoding or "identity").strip().lower()
+
+    try:
+        if encoding == "identity":
+            out = body
+        elif encoding in ("gzip", "x-gzip"):
+            d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            out = d.decompress(body, max_size + 1)
+            if len(out) <= max_size and not d.eof:
+                raise BatchDecodeError("truncated body")
+        elif encoding == "zstd" and _zstd is not None:
+            d = _zstd.ZstdDecompressor()
+            out = d.decompress(body, max_length=max_size + 1)
+            if len(out) <= max_size and not d.eof:
+                raise BatchDecodeError("truncated body")
+        elif encoding == "zstd" and _zstandard is not None:
+            with _zstandard.ZstdDecompressor().stream_reader(body) as reader:
+                out = reader.read(max_size + 1)
+        else:
+            raise UnsupportedBatchEncoding("unsupported content encoding")
+    except BatchDecodeError:
+        raise
+    except Exception as e:
+        raise BatchDecodeError("invalid compressed body") from e
+
+    if len(out) > max_size:
+        raise BatchTooLarge("body too large")
+    return out
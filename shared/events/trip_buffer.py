@@ -0,0 +1,54 @@
+from typing import Dict, List
+
+
+def _event_type(ev: dict) -> str:
+    return str(ev.get("event_type") or ev.get("event") or "db_update").strip()
+
+
+class TripEventBuffer:
+    """
+    Buffer con clave trip_id que coalesce eventos redundantes:
+      - se queda solo con el último estado de cada trip
+      - delete gana sobre insert/update
+      - insert seguido de update se mantiene como insert (con el trip más reciente)
+    El orden relativo entre trips distintos se conserva (orden del último evento).
+    Eventos sin trip_id pasan sin coalescer.
+    """
+
+    def __init__(self) -> None:
+        self._events: Dict[str, dict] = {}
+        self._anon = 0
+        self.received = 0
+        self.merged = 0
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def add(self, ev: dict) -> None:
+        self.received += 1
+
+        trip_id = str(ev.get("trip_id") or "").strip()
+        if not trip_id:
+            self._anon += 1
+            self._events[f"\0{self._anon}"] = ev
+            return
+
+        prev = self._events.pop(trip_id, None)
+        if prev is not None:
+            self.merged += 1
+            prev_type = _event_type(prev)
+            if prev_type == "delete":
+                ev = prev
+            elif prev_type == "insert" and _event_type(ev) != "delete":
+                ev = {**ev, "event_type": "insert"}
+
+        self._events[trip_id] = ev
+
+    def extend(self, events: List[dict]) -> None:
+        for ev in events:
+            self.add(ev)
+
+    def drain(self) -> List[dict]:
+        events = list(self._events.values())
+        self._events.clear()
+        return events
@@ -0,0 +1,87 @@
+"""
+Métricas Prometheus del pipeline de trips.
+
+Cada evento sale del streaming con origin_ts (epoch en segundos, cuando
+llegó el cambio de Postgres). Con eso medimos la latencia desde el commit
+hasta cada etapa en trip_pipeline_latency_seconds{stage}:
+
+  - received: el webhook (o el sink directo) recibió el batch
+  - published: cache + publish aplicados en Redis (mismo MULTI)
+  - dispatched: el listener de la location en la API leyó el batch del bus
+  - sent: frame enviado al socket (1 muestra por socket y frame, con el
+    evento más viejo del frame)
+
+Con varios workers de uvicorn cada proceso expone sus propias métricas.
+
+GET /metrics está en PUBLIC_PATHS (sin JWT) pero exige METRICS_TOKEN: sin
+token configurado la ruta no se monta, nunca se sirve sin auth.
+"""
+import hmac
+import time
+from typing import Iterable, Optional
+
+from fastapi import APIRouter, Request, Response, HTTPException
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from shared.settings import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+TRIP_PIPELINE_LATENCY = Histogram(
+    "trip_pipeline_latency_seconds",
+    "Latency from the trip change in Postgres (origin_ts) to each pipeline stage",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+TRIP_INGEST_EVENTS = Counter(
+    "trip_ingest_events_total",
+    "Trip events applied to Redis, by result",
+    ["result"],
+)
+WS_CONNECTIONS = Gauge("ws_connections", "Open trip websockets in this process")
+WS_FRAMES_SENT = Counter("ws_frames_sent_total", "Frames sent to trip websockets")
+TRIP_BUS_GAPS = Counter("trip_bus_gaps_total", "Seq gaps seen by the location listeners")
+
+
+def observe_origin(stage: str, origin_ts, now: Optional[float] = None) -> None:
+    if not isinstance(origin_ts, (int, float)):
+        return
+    now = time.time() if now is None else now
+    TRIP_PIPELINE_LATENCY.labels(stage).observe(max(0.0, now - origin_ts))
+
+
+def observe_events(stage: str, events: Iterable) -> None:
+    """1 muestra por evento que traiga origin_ts."""
+    now = time.time()
+    hist = TRIP_PIPELINE_LATENCY.labels(stage)
+    for ev in events:
+        origin_ts = ev.get("origin_ts") if isinstance(ev, dict) else None
+        if isinstance(origin_ts, (int, float)):
+            hist.observe(max(0.0, now - origin_ts))
+
+
+def oldest_origin(events: Iterable) -> Optional[float]:
+    oldest = None
+    for ev in events:
+        origin_ts = ev.get("origin_ts") if isinstance(ev, dict) else None
+        if isinstance(origin_ts, (int, float)) and (oldest is None or origin_ts < oldest):
+            oldest = origin_ts
+    return oldest
+
+
+# ----------------- ENDPOINT -----------------
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics", include_in_schema=False)
+async def metrics(request: Request) -> Response:
+    # /metrics es pública para el middleware de JWT: Prometheus se autentica
+    # con "Authorization: Bearer <METRICS_TOKEN>" (sin token, no hay métricas)
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    provided = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(provided.encode(), settings.METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
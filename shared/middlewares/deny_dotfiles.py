@@ -1,12 +1,16 @@
-import logging
-from datetime import datetime, timezone
-from starlette.middleware.base import BaseHTTPMiddleware
-from fastapi import Request
 from fastapi.responses import PlainTextResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 
-class DenyDotfileMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        if request.url.path.startswith('/.'):
-            return PlainTextResponse('Not found', status_code=404)
-        return await call_next(request)
\ No newline at end of file
+class DenyDotfileMiddleware:
+    """Middleware ASGI puro: 404 a cualquier path que empiece con '/.'."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith('/.'):
+            response = PlainTextResponse('Not found', status_code=404)
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
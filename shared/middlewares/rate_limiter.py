@@ -1,27 +1,51 @@
-from starlette.middleware.base import BaseHTTPMiddleware
-from fastapi import Request
 from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import redis.asyncio as redis
 from shared.redis.redis_client import redis_client 
+from shared.redis.rate_limit import ALGORITHMS, LeasedRateLimiter, RateLimitResult
+from shared.middlewares.route_trie import RouteTrie
+from shared.settings import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
+UNMATCHED = "<unmatched>"
+
+class RateLimitMiddleware:
     """
-    Middleware de rate limiting con Redis.
+    Middleware de rate limiting con Redis (ASGI puro: sin la task y el
+    stream extra por request de BaseHTTPMiddleware).
     """
     
     def __init__(
         self, 
-        app, 
+        app: ASGIApp, 
         default_limit: int = 100, 
-        default_window: int = 3600
+        default_window: int = 3600,
+        algorithm: str | None = None,
+        lease_max: int | None = None
     ):
-        super().__init__(app)
+        self.app = app
         self.default_limit = default_limit
         self.default_window = default_window
-        self.route_limits = {}
+        self.algorithm = algorithm or settings.RATE_LIMIT_ALGORITHM
+        if self.algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown rate limit algorithm: {self.algorithm}")
+        # fixed conserva las keys de siempre; los otros usan otro tipo de dato
+        self.key_prefix = "ratelimit" if self.algorithm == "fixed" else f"ratelimit:{self.algorithm}"
+        # tier local: cuota tomada a Redis por lotes (lease_max=1 lo desactiva)
+        self.limiter = LeasedRateLimiter(
+            redis_client,
+            self.algorithm,
+            lease_max=settings.RATE_LIMIT_LEASE_MAX if lease_max is None else lease_max,
+            lease_fraction=settings.RATE_LIMIT_LEASE_FRACTION,
+            max_keys=settings.RATE_LIMIT_LOCAL_KEYS,
+        )
+        self.route_limits = {
+            # scrapes de Prometheus
+            "/metrics": (1000, 60),
+        }
 
         """
         
@@ -36,67 +60,87 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
             "/health": (1000, 60),
         
         """
+        # se compila al arrancar (o en el primer request si no hubo lifespan)
+        self.routes: RouteTrie | None = None
     
-    def _get_limit_for_path(self, path: str) -> tuple[int, int]:
-        """Obtiene el límite y ventana para una ruta específica."""
-        if hasattr(self, "route_limits") and path in self.route_limits:
-            return self.route_limits[path]
-        
-        if hasattr(self, "route_limits"):
-            for route_pattern, limits in self.route_limits.items():
-                if path.startswith(route_pattern.rstrip("/")):
-                    return limits
-        
-        return self.default_limit, self.default_window
-    
-    def _get_client_ip(self, request: Request) -> str:
+    def _compile_routes(self, app) -> RouteTrie:
+        """Resuelve route_limits contra las rutas de la app (1 vez)."""
+        self.routes = RouteTrie.from_app(app, self.route_limits, (self.default_limit, self.default_window))
+        return self.routes
+
+    def _get_client_ip(self, scope: Scope, headers: Headers) -> str:
         """Obtiene la IP real del cliente."""
-        forwarded = request.headers.get("x-forwarded-for")
+        forwarded = headers.get("x-forwarded-for")
         if forwarded:
             return forwarded.split(",")[0].strip()
         
-        real_ip = request.headers.get("x-real-ip")
+        real_ip = headers.get("x-real-ip")
         if real_ip:
             return real_ip
         
-        return request.client.host if request.client else "unknown"
+        client = scope.get("client")
+        return client[0] if client else "unknown"
     
-    async def dispatch(self, request: Request, call_next):
-        if request.method == "OPTIONS":
-            return await call_next(request)
+    def _headers(self, result: RateLimitResult, window: int) -> dict:
+        """Headers RateLimit-* (draft IETF httpapi-ratelimit-headers)."""
+        return {
+            "RateLimit-Limit": str(result.limit),
+            "RateLimit-Remaining": str(result.remaining),
+            "RateLimit-Reset": str(result.reset_seconds),
+            "RateLimit-Policy": f"{result.limit};w={window}",
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            # al arrancar ya están todas las rutas registradas
+            if self.routes is None:
+                self._compile_routes(scope["app"])
+            await self.app(scope, receive, send)
+            return
+
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
         
-        client_ip = self._get_client_ip(request)
-        path = request.url.path
-        method = request.method
+        client_ip = self._get_client_ip(scope, Headers(scope=scope))
+        method = scope["method"]
+        routes = self.routes or self._compile_routes(scope["app"])
         
-        key = f"ratelimit:{client_ip}:{method}:{path}"
-        limit, window = self._get_limit_for_path(path)
+        # 1 key por template de ruta (no por path concreto): /v1/locations/<uuid>/trips
+        # comparte cuota entre locations; los 404 comparten una sola key
+        template, limit, window = routes.match(scope["path"])
+        key = f"{self.key_prefix}:{client_ip}:{method}:{UNMATCHED if template is None else template}"
         
         try:
-            r = redis_client  # Usa la instancia global
-            current = await r.incr(key)
-            
-            if current == 1:
-                await r.expire(key, window)
-            
-            ttl = await r.ttl(key)
-            
-            if current > limit:
-                return JSONResponse(
-                    {
-                        "detail": "Too many requests. Try again later.",
-                        "retry_after": ttl
-                    },
-                    status_code=429
-                )
-            
-            response = await call_next(request)
-
-            return response
-            
+            # en memoria si hay cuota local; si no, 1 EVALSHA atómico
+            result = await self.limiter.hit(key, limit, window)
         except redis.ConnectionError:
             logger.warning("Redis unavailable for rate limiting, allowing request")
-            return await call_next(request)
+            await self.app(scope, receive, send)
+            return
         except Exception as e:
             logger.error(f"Rate limit error: {e}")
-            return await call_next(request)
\ No newline at end of file
+            await self.app(scope, receive, send)
+            return
+
+        headers = self._headers(result, window)
+
+        if not result.allowed:
+            response = JSONResponse(
+                {
+                    "detail": "Too many requests. Try again later.",
+                    "retry_after": result.reset_seconds
+                },
+                status_code=429,
+                headers={**headers, "Retry-After": str(result.reset_seconds)}
+            )
+            await response(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                MutableHeaders(scope=message).update(headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
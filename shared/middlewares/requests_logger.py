@@ -1,33 +1,126 @@
+"""
+Access log estructurado: 1 línea JSON por request HTTP.
+
+    {"ts": "...", "method": "GET", "path": "/v1/locations/<id>/trips",
+     "route": "/v1/locations/{location_id}/trips", "status": 200,
+     "duration_ms": 3.21, "ip": "...", "user_id": "...", "sample_rate": 1.0}
+
+En el request solo se arma un dict; el JSON y la escritura a stdout los hace
+un QueueListener en su propio thread (QueueHandler -> cola -> StreamHandler),
+así el event loop nunca espera I/O de logs.
+
+Muestreo: las rutas de alto volumen (ACCESS_LOG_ROUTE_SAMPLE_RATES, por
+template) se loguean con probabilidad rate; el resto con
+ACCESS_LOG_SAMPLE_RATE. Los errores (status >= 400) se loguean siempre.
+"""
+import atexit
 import logging
+import queue
+import random
+import sys
+import time
 from datetime import datetime, timezone
-from starlette.middleware.base import BaseHTTPMiddleware
-from fastapi import Request
-
-
-logger = logging.getLogger(__name__) 
-
-class RequestLoggerMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        client_ip = request.client.host if request.client else "unknown"
-        method = request.method
-        url = request.url.path
-        user_agent = request.headers.get("user-agent", "unknown")
-        referer = request.headers.get("referer", "unknown")
-        origin = request.headers.get("origin", "unknown")
-        
-        logger.info(f"""
-        📥 Incoming Request:
-        - IP: {client_ip}
-        - Method: {method}
-        - Path: {url}
-        - User-Agent: {user_agent}
-        - Origin: {origin}
-        - Referer: {referer}
-        - Time: {datetime.now(timezone.utc)}
-        """)
-        
-        response = await call_next(request)
-        
-        logger.info(f"📤 Response Status: {response.status_code}")
-        
-        return response
\ No newline at end of file
+from logging.handlers import QueueHandler, QueueListener
+
+import orjson
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from shared.settings import settings
+
+
+access_logger = logging.getLogger("access")
+
+_listener: QueueListener | None = None
+
+
+class _JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        if isinstance(record.msg, dict):
+            ts = datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds")
+            return orjson.dumps({"ts": ts, **record.msg}, default=str).decode()
+        return super().format(record)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    # QueueHandler.prepare formatea en el thread que loguea; lo dejamos
+    # para el listener (la cola es en memoria, no hace falta serializar)
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def start_access_log() -> None:
+    """Configura el logger "access" con su QueueListener (idempotente)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(_JSONFormatter())
+
+    log_queue = queue.SimpleQueue()
+    access_logger.addHandler(_DeferredQueueHandler(log_queue))
+    access_logger.setLevel(logging.INFO)
+    access_logger.propagate = False
+
+    _listener = QueueListener(log_queue, output)
+    _listener.start()
+    # al salir: vacía la cola y frena el thread
+    atexit.register(_listener.stop)
+
+
+class RequestLoggerMiddleware:
+    """Middleware ASGI puro: access log JSON (ver docstring del módulo)."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        sample_rate: float | None = None,
+        route_sample_rates: dict | None = None,
+    ) -> None:
+        self.app = app
+        self.sample_rate = settings.ACCESS_LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.route_sample_rates = (
+            settings.ACCESS_LOG_ROUTE_SAMPLE_RATES if route_sample_rates is None else route_sample_rates
+        )
+        start_access_log()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not access_logger.isEnabledFor(logging.INFO):
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self._log(scope, status, start)
+
+    def _log(self, scope: Scope, status: int, start: float) -> None:
+        # la ruta que resolvió el router (template, no el path concreto)
+        route = getattr(scope.get("route"), "path", None)
+        rate = 1.0 if status >= 400 else self.route_sample_rates.get(route, self.sample_rate)
+        if rate < 1.0 and random.random() >= rate:
+            return
+
+        # request.state.user_data (lo deja VerifyToken en scope["state"])
+        user_data = scope.get("state", {}).get("user_data") or {}
+        client = scope.get("client")
+
+        access_logger.info({
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": route,
+            "status": status,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+            "ip": client[0] if client else None,
+            "user_id": user_data.get("id"),
+            "sample_rate": rate,
+        })
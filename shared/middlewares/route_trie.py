@@ -0,0 +1,165 @@
+"""
+Resolución de rutas para los middlewares (rate limit, logs).
+
+Se compila una vez, al arrancar, desde la tabla de rutas de FastAPI: un trie
+por segmento de path donde los parámetros ({location_id}) son un nodo
+comodín. Cada request se resuelve con un dict (rutas sin parámetros) o en
+O(#segmentos) a:
+
+  - template: el path de la ruta ("/v1/locations/{location_id}/trips"),
+    o None si no corresponde a ninguna ruta
+  - limit/window: el límite del prefijo más largo de route_limits (por
+    segmento, no por string: "/health" no incluye "/healthz"); se calcula
+    al compilar, no por request
+
+Los segmentos literales tienen prioridad sobre los parámetros (con
+backtracking). Starlette en cambio resuelve por orden de declaración: si un
+"/{id}" se declaró antes que un literal hermano, el template puede diferir
+de la ruta que realmente atiende el request; para rate limiting da igual.
+"""
+from typing import Iterable, NamedTuple, Optional
+
+from starlette.routing import Mount
+
+MAX_SEGMENTS = 32
+
+
+class RouteMatch(NamedTuple):
+    template: Optional[str]
+    limit: int
+    window: int
+
+
+class _Node:
+    __slots__ = ("literal", "param", "catch_all", "template", "own_limits", "limits")
+
+    def __init__(self) -> None:
+        self.literal: dict = {}
+        self.param: Optional["_Node"] = None
+        self.catch_all: Optional["_Node"] = None
+        self.template: Optional[str] = None
+        self.own_limits: Optional[tuple] = None
+        self.limits: Optional[tuple] = None
+
+
+def _segments(path: str) -> list:
+    segments = path.strip("/").split("/")
+    return segments if "" not in segments else [segment for segment in segments if segment]
+
+
+class RouteTrie:
+    def __init__(self, default_limits: tuple) -> None:
+        self.root = _Node()
+        self.root.own_limits = default_limits
+        # rutas sin parámetros: 1 lookup en un dict, sin recorrer el trie
+        self.exact: dict = {}
+
+    @classmethod
+    def from_app(cls, app, route_limits: dict, default_limits: tuple) -> "RouteTrie":
+        trie = cls(default_limits)
+        for template in iter_route_templates(app.routes):
+            trie.add_route(template)
+        for pattern, limits in route_limits.items():
+            trie.add_limits(pattern, limits)
+        trie.freeze()
+        return trie
+
+    def _insert(self, path: str) -> _Node:
+        node = self.root
+        for segment in _segments(path):
+            if segment.startswith("{") and segment.endswith(":path}"):
+                node.catch_all = node.catch_all or _Node()
+                node = node.catch_all
+                break
+            if "{" in segment:
+                node.param = node.param or _Node()
+                node = node.param
+            else:
+                node = node.literal.setdefault(segment, _Node())
+        return node
+
+    def add_route(self, template: str) -> None:
+        node = self._insert(template)
+        # misma forma declarada dos veces: gana la primera, como en Starlette
+        if node.template is None:
+            node.template = template
+        if "{" not in template:
+            self.exact.setdefault(template, None)
+
+    def add_limits(self, pattern: str, limits: tuple) -> None:
+        self._insert(pattern).own_limits = tuple(limits)
+
+    def freeze(self) -> None:
+        """Propaga a cada nodo el límite del prefijo configurado más largo."""
+        stack = [(self.root, self.root.own_limits)]
+        while stack:
+            node, inherited = stack.pop()
+            node.limits = node.own_limits or inherited
+            children = list(node.literal.values()) + [c for c in (node.param, node.catch_all) if c]
+            stack.extend((child, node.limits) for child in children)
+        for path in self.exact:
+            self.exact[path] = self._match(path)
+
+    def _walk(self, node: _Node, segments: list, i: int) -> Optional[_Node]:
+        if i == len(segments):
+            if node.template is not None:
+                return node
+            if node.catch_all is not None and node.catch_all.template is not None:
+                return node.catch_all
+            return None
+
+        child = node.literal.get(segments[i])
+        if child is not None and (found := self._walk(child, segments, i + 1)) is not None:
+            return found
+        if node.param is not None and (found := self._walk(node.param, segments, i + 1)) is not None:
+            return found
+        if node.catch_all is not None and node.catch_all.template is not None:
+            return node.catch_all
+        return None
+
+    def _fast_walk(self, segments: list) -> Optional[_Node]:
+        """Camino sin backtracking (el caso normal); None si no llega a una ruta."""
+        node = self.root
+        for segment in segments:
+            child = node.literal.get(segment) or node.param
+            if child is None:
+                catch_all = node.catch_all
+                return catch_all if catch_all is not None and catch_all.template is not None else None
+            node = child
+        return node if node.template is not None else None
+
+    def match(self, path: str) -> RouteMatch:
+        return self.exact.get(path) or self._match(path)
+
+    def _match(self, path: str) -> RouteMatch:
+        segments = _segments(path)
+        found = None
+        if len(segments) <= MAX_SEGMENTS:
+            found = self._fast_walk(segments) or self._walk(self.root, segments, 0)
+        if found is not None:
+            return RouteMatch(found.template, *found.limits)
+
+        # sin ruta (404): el límite del prefijo literal más largo
+        node = self.root
+        for segment in segments:
+            child = node.literal.get(segment)
+            if child is None:
+                break
+            node = child
+        return RouteMatch(None, *node.limits)
+
+
+def iter_route_templates(routes: Iterable, prefix: str = "") -> Iterable:
+    """Paths (templates) de todas las rutas, incluidos routers y mounts anidados."""
+    for route in routes:
+        if hasattr(route, "effective_candidates"):
+            # FastAPI reciente: include_router agrega un nodo que se expande lazy
+            yield from iter_route_templates(route.effective_candidates(), prefix)
+        elif isinstance(route, Mount):
+            sub_routes = route.routes
+            if sub_routes:
+                yield from iter_route_templates(sub_routes, prefix + route.path)
+            else:
+                yield prefix + route.path + "/{path:path}"
+        elif getattr(route, "path", None) is not None:
+            yield prefix + route.path
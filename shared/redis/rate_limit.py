@@ -0,0 +1,245 @@
+"""
+Rate limiting en Redis: 1 comando (EVALSHA) por request.
+
+Cada algoritmo es un script Lua que decide y retorna {allowed, remaining,
+reset_ms} de forma atómica; el TTL se pone en el mismo script, así que una
+key nunca queda sin expirar aunque el proceso muera a mitad de camino.
+
+  - fixed:        INCR + PEXPIRE por ventana fija (string)
+  - sliding:      log de timestamps en un ZSET (ventana deslizante exacta,
+                  O(limit) de memoria por key)
+  - token_bucket: hash {tokens, ts}; recarga limit tokens por ventana y
+                  admite ráfagas de hasta limit
+
+sliding y token_bucket usan el reloj de Redis (TIME), no el de cada worker.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+ALGORITHMS = ("fixed", "sliding", "token_bucket")
+
+# KEYS[1] = key, ARGV[1] = limit, ARGV[2] = window_ms, ARGV[3] = requested
+# Retorna {granted, remaining, reset_ms}; granted <= requested (0 = denegado)
+_FIXED_LUA = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local granted = math.min(requested, math.max(limit - current, 0))
+if granted > 0 then
+  current = redis.call('INCRBY', KEYS[1], granted)
+end
+local ttl = redis.call('PTTL', KEYS[1])
+if ttl == -1 then
+  redis.call('PEXPIRE', KEYS[1], window)
+  ttl = window
+elseif ttl == -2 then
+  ttl = window
+end
+return {granted, math.max(limit - current, 0), ttl}
+"""
+
+_SLIDING_LUA = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local count = redis.call('ZCARD', KEYS[1])
+local granted = math.min(requested, math.max(limit - count, 0))
+for i = 1, granted do
+  redis.call('ZADD', KEYS[1], now, t[1] .. t[2] .. ':' .. (count + i))
+end
+count = count + granted
+redis.call('PEXPIRE', KEYS[1], window)
+local reset = window
+if count >= limit then
+  local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+  if oldest[2] then reset = tonumber(oldest[2]) + window - now end
+end
+return {granted, math.max(limit - count, 0), reset}
+"""
+
+_TOKEN_BUCKET_LUA = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local rate = limit / window
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or limit
+local ts = tonumber(state[2]) or now
+tokens = math.min(limit, tokens + math.max(0, now - ts) * rate)
+local granted = math.min(requested, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], window)
+local reset
+if granted > 0 then
+  reset = math.ceil((limit - tokens) / rate)
+else
+  reset = math.ceil((1 - tokens) / rate)
+end
+return {granted, math.floor(tokens), reset}
+"""
+
+_LUA = {
+    "fixed": _FIXED_LUA,
+    "sliding": _SLIDING_LUA,
+    "token_bucket": _TOKEN_BUCKET_LUA,
+}
+
+_scripts: dict = {}
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_ms: int
+
+    @property
+    def reset_seconds(self) -> int:
+        """Segundos (hacia arriba) hasta que se recupera cuota."""
+        return max(0, -(-self.reset_ms // 1000))
+
+
+def _script(redis, algorithm: str):
+    # register_script: EVALSHA con fallback automático a EVAL (NOSCRIPT)
+    script = _scripts.get((id(redis), algorithm))
+    if script is None:
+        script = _scripts[(id(redis), algorithm)] = redis.register_script(_LUA[algorithm])
+    return script
+
+
+async def acquire(redis, key: str, limit: int, window_seconds: int, algorithm: str = "fixed", requested: int = 1) -> tuple:
+    """
+    Toma hasta requested unidades de la cuota de key en 1 EVALSHA.
+    Retorna (granted, remaining, reset_ms).
+    """
+    granted, remaining, reset_ms = await _script(redis, algorithm)(
+        keys=[key],
+        args=[limit, window_seconds * 1000, requested],
+    )
+    return int(granted), int(remaining), int(reset_ms)
+
+
+async def hit(redis, key: str, limit: int, window_seconds: int, algorithm: str = "fixed") -> RateLimitResult:
+    """Consume 1 request de la cuota de key y retorna la decisión."""
+    granted, remaining, reset_ms = await acquire(redis, key, limit, window_seconds, algorithm)
+    return RateLimitResult(granted > 0, limit, remaining, reset_ms)
+
+
+# ----------------- TIER LOCAL -----------------
+
+class _Lease:
+    __slots__ = ("tokens", "remaining", "expires_at", "exhausted", "refill")
+
+    def __init__(self) -> None:
+        self.tokens = 0
+        self.remaining = 0
+        self.expires_at = 0.0
+        self.exhausted = False
+        self.refill: Optional[asyncio.Task] = None
+
+
+class LeasedRateLimiter:
+    """
+    Rate limiter en 2 niveles: un bucket en memoria por key que se alimenta
+    de cuota tomada a Redis por lotes (leases).
+
+    Cada worker pide a Redis hasta lease_size unidades de una vez (mismo
+    script atómico) y las consume localmente; cuando le queda la mitad pide
+    el siguiente lote en segundo plano. Redis nunca otorga más que el límite
+    en total, así que entre todos los workers el límite global se respeta;
+    lo que se pierde es precisión hacia abajo: cuota tomada y no usada por
+    un worker (a lo sumo ~lease_size por worker y key) no la ve el resto.
+
+    lease_size = min(lease_max, limit // lease_fraction): los límites chicos
+    (p. ej. 5/min en sign-in) quedan en 1 y van a Redis en cada request,
+    exactos. Una key sin cuota se deniega localmente hasta su reset.
+    """
+
+    def __init__(
+        self,
+        redis,
+        algorithm: str = "fixed",
+        lease_max: int = 50,
+        lease_fraction: int = 20,
+        max_keys: int = 10_000,
+    ) -> None:
+        self.redis = redis
+        self.algorithm = algorithm
+        self.lease_max = lease_max
+        self.lease_fraction = lease_fraction
+        self.max_keys = max_keys
+        self._leases: OrderedDict = OrderedDict()
+
+    def lease_size(self, limit: int) -> int:
+        return max(1, min(self.lease_max, limit // self.lease_fraction))
+
+    def _validity_ms(self, granted: int, reset_ms: int, window_seconds: int) -> int:
+        # fixed: hasta el fin de la ventana; sin cuota: hasta que se recupere;
+        # sliding/token_bucket: lo tomado vale a lo sumo una ventana
+        if self.algorithm == "fixed" or granted == 0:
+            return reset_ms
+        return window_seconds * 1000
+
+    async def _take(self, lease: _Lease, key: str, limit: int, window_seconds: int, size: int) -> None:
+        granted, remaining, reset_ms = await acquire(self.redis, key, limit, window_seconds, self.algorithm, size)
+        lease.tokens += granted
+        lease.remaining = remaining
+        lease.exhausted = remaining == 0
+        lease.expires_at = time.monotonic() + self._validity_ms(granted, reset_ms, window_seconds) / 1000
+
+    def _start_refill(self, lease: _Lease, key: str, limit: int, window_seconds: int, size: int) -> asyncio.Task:
+        # 1 pedido a Redis en vuelo por key, lo comparten los requests que esperan
+        task = asyncio.create_task(self._take(lease, key, limit, window_seconds, size))
+        lease.refill = task
+        task.add_done_callback(lambda t: self._refill_done(lease, t))
+        return task
+
+    @staticmethod
+    def _refill_done(lease: _Lease, task: asyncio.Task) -> None:
+        lease.refill = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Rate limit lease refill failed: {task.exception()}")
+
+    def _lease(self, key: str, now: float) -> _Lease:
+        lease = self._leases.get(key)
+        if lease is None or (lease.expires_at <= now and lease.refill is None):
+            lease = self._leases[key] = _Lease()
+            if len(self._leases) > self.max_keys:
+                self._leases.popitem(last=False)
+        else:
+            self._leases.move_to_end(key)
+        return lease
+
+    async def hit(self, key: str, limit: int, window_seconds: int) -> RateLimitResult:
+        size = self.lease_size(limit)
+        if size <= 1:
+            return await hit(self.redis, key, limit, window_seconds, self.algorithm)
+
+        lease = self._lease(key, time.monotonic())
+        while lease.tokens == 0 and (not lease.exhausted or lease.expires_at <= time.monotonic()):
+            # sin cuota local: esperar el lote (si Redis falla la excepción
+            # sube y el middleware deja pasar el request, como antes). En una
+            # ráfaga otros requests pueden vaciarlo antes: pedir otro
+            refill = lease.refill or self._start_refill(lease, key, limit, window_seconds, size)
+            await asyncio.shield(refill)
+
+        reset_ms = max(0, int((lease.expires_at - time.monotonic()) * 1000))
+        if lease.tokens == 0:
+            return RateLimitResult(False, limit, 0, reset_ms)
+
+        lease.tokens -= 1
+        if lease.tokens <= size // 2 and not lease.exhausted and lease.refill is None:
+            self._start_refill(lease, key, limit, window_seconds, size)
+        return RateLimitResult(True, limit, lease.remaining + lease.tokens, reset_ms)
@@ -1,3 +1,4 @@
 import redis.asyncio as redis
+from shared.settings import settings
 
-redis_client = redis.Redis(host="redis", port=6379, db=0, decode_responses=True)
\ No newline at end of file
+redis_client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
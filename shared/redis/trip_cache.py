@@ -0,0 +1,280 @@
+"""
+Cache de trips por location en Redis.
+
+Dos layouts (settings.TRIP_CACHE_LAYOUT):
+
+  - "keys" (default): 1 string por trip + set índice
+        SET trip:{trip_id} <json> EX ttl ; SADD loc:{location_id}:trips <trip_id>
+    snapshot = SSCAN + MGET por página; los ids del set pueden apuntar a
+    strings ya expirados.
+
+  - "hash": 1 hash por location + un ZSET con la hora de escritura de cada trip
+        HSET loc:{location_id}:trips <trip_id> <json>
+        ZADD loc:{location_id}:trips:ts <ms> <trip_id>
+    snapshot = HSCAN de una sola key, delete = HDEL. Redis (< 7.4) no expira
+    campos de un hash, así que el TTL por trip se aplica al escribir: cada
+    touch_location borra los trips sin cambios en TRIP_TTL_SECONDS (script
+    Lua) y renueva el TTL de las 2 keys.
+
+Ambos layouts usan la misma key loc:{location_id}:trips (con distinto tipo):
+antes de cambiar TRIP_CACHE_LAYOUT hay que correr la migración, si no las
+escrituras fallan con WRONGTYPE en las locations ya cacheadas:
+
+    python -m shared.redis.trip_cache migrate --to hash
+"""
+import argparse
+import asyncio
+import time
+from typing import Optional
+
+import orjson
+from redis.exceptions import WatchError
+
+from shared.settings import settings
+
+TRIP_TTL_SECONDS = settings.TRIP_TTL_SECONDS
+TRIP_CACHE_LAYOUT = settings.TRIP_CACHE_LAYOUT
+LAYOUTS = ("hash", "keys")
+
+
+def index_key(location_id: str) -> str:
+    return f"loc:{location_id}:trips"
+
+
+def written_key(location_id: str) -> str:
+    return f"loc:{location_id}:trips:ts"
+
+
+def trip_key(trip_id: str) -> str:
+    return f"trip:{trip_id}"
+
+
+# KEYS[1] = hash, KEYS[2] = zset de escrituras
+# ARGV[1] = cutoff (ms; se borran los trips escritos antes), ARGV[2] = ttl (s)
+_TOUCH_HASH_LUA = """
+local stale = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1], 'LIMIT', 0, 1000)
+if #stale > 0 then
+  redis.call('HDEL', KEYS[1], unpack(stale))
+  redis.call('ZREM', KEYS[2], unpack(stale))
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return #stale
+"""
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _decode(v):
+    if isinstance(v, (bytes, bytearray)):
+        v = v.decode("utf-8", errors="ignore")
+    return v
+
+
+# ----------------- WRITE (pipeline) -----------------
+
+def cache_trip(pipe, location_id: str, trip_id: str, trip_json: str | bytes, nx: bool = False, layout: Optional[str] = None) -> None:
+    """
+    Encola en el pipeline la escritura de un trip ya serializado.
+    nx=True no pisa una versión existente (usado al repoblar desde Postgres).
+    """
+    layout = layout or TRIP_CACHE_LAYOUT
+    idx_key = index_key(location_id)
+
+    if layout == "hash":
+        if nx:
+            pipe.hsetnx(idx_key, trip_id, trip_json)
+        else:
+            pipe.hset(idx_key, trip_id, trip_json)
+        pipe.zadd(written_key(location_id), {trip_id: _now_ms()}, nx=nx)
+        return
+
+    pipe.set(trip_key(trip_id), trip_json, ex=TRIP_TTL_SECONDS, nx=nx)
+    pipe.sadd(idx_key, trip_id)
+
+
+def uncache_trip(pipe, location_id: str, trip_id: str, layout: Optional[str] = None) -> None:
+    layout = layout or TRIP_CACHE_LAYOUT
+
+    if layout == "hash":
+        pipe.hdel(index_key(location_id), trip_id)
+        pipe.zrem(written_key(location_id), trip_id)
+        return
+
+    pipe.delete(trip_key(trip_id))
+    pipe.srem(index_key(location_id), trip_id)
+
+
+def touch_location(pipe, location_id: str, layout: Optional[str] = None) -> None:
+    """
+    Renueva el TTL del índice/hash de la location, para que se limpie solo
+    si queda vacío/abandonado. En el layout "hash" además borra los trips
+    que expiraron (1 vez por location y batch, no por evento).
+    """
+    layout = layout or TRIP_CACHE_LAYOUT
+
+    if layout == "hash":
+        # EVAL y no EVALSHA: va dentro de MULTI y así no hay NOSCRIPT que reintentar
+        pipe.eval(
+            _TOUCH_HASH_LUA,
+            2,
+            index_key(location_id),
+            written_key(location_id),
+            _now_ms() - TRIP_TTL_SECONDS * 1000,
+            TRIP_TTL_SECONDS,
+        )
+        return
+
+    pipe.expire(index_key(location_id), TRIP_TTL_SECONDS)
+
+
+# ----------------- READ -----------------
+
+async def _load_keys_page(redis, trip_ids: list) -> tuple:
+    values = await redis.mget([trip_key(tid) for tid in trip_ids])
+
+    trips = []
+    missing = 0
+    for v in values:
+        if not v:
+            missing += 1
+            continue
+        try:
+            trips.append(orjson.loads(v))
+        except Exception:
+            continue
+    return trips, missing
+
+
+async def iter_cached_trips(redis, location_id: str, page_size: int, layout: Optional[str] = None):
+    """
+    Recorre el cache de la location en páginas de hasta page_size trips.
+    Entrega (trips, missing): missing cuenta ids del índice cuyo trip ya
+    expiró (solo layout "keys"; en "hash" siempre 0).
+    """
+    layout = layout or TRIP_CACHE_LAYOUT
+    idx_key = index_key(location_id)
+    # SCAN puede repetir elementos entre iteraciones; deduplicamos
+    seen = set()
+
+    if layout == "hash":
+        page = []
+        async for field, value in redis.hscan_iter(idx_key, count=page_size):
+            field = _decode(field)
+            if field in seen:
+                continue
+            seen.add(field)
+            try:
+                page.append(orjson.loads(value))
+            except Exception:
+                continue
+            if len(page) >= page_size:
+                yield page, 0
+                page = []
+        if page:
+            yield page, 0
+        return
+
+    page = []
+    async for tid in redis.sscan_iter(idx_key, count=page_size):
+        tid = str(_decode(tid))
+        if tid in seen:
+            continue
+        seen.add(tid)
+        page.append(tid)
+        if len(page) >= page_size:
+            yield await _load_keys_page(redis, page)
+            page = []
+    if page:
+        yield await _load_keys_page(redis, page)
+
+
+# ----------------- MIGRATION -----------------
+
+async def migrate_location(redis, location_id: str, to_layout: str) -> int:
+    """
+    Convierte el cache de una location al layout indicado. Lee y reescribe
+    con WATCH + MULTI: si una escritura toca las keys entre la lectura y el
+    EXEC, la transacción se descarta y se vuelve a leer. Retorna cuántos
+    trips se migraron.
+    """
+    idx_key = index_key(location_id)
+
+    async with redis.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                await pipe.watch(idx_key)
+                key_type = _decode(await pipe.type(idx_key))
+
+                if to_layout == "hash" and key_type == "set":
+                    trip_ids = [str(_decode(t)) for t in await pipe.smembers(idx_key)]
+                    trip_keys = [trip_key(t) for t in trip_ids]
+                    if trip_keys:
+                        await pipe.watch(*trip_keys)
+                    values = await pipe.mget(trip_keys) if trip_keys else []
+                    mapping = {tid: _decode(v) for tid, v in zip(trip_ids, values) if v}
+
+                    pipe.multi()
+                    pipe.delete(idx_key, written_key(location_id), *trip_keys)
+                    if mapping:
+                        now = _now_ms()
+                        pipe.hset(idx_key, mapping=mapping)
+                        pipe.zadd(written_key(location_id), {tid: now for tid in mapping})
+                        pipe.expire(idx_key, TRIP_TTL_SECONDS)
+                        pipe.expire(written_key(location_id), TRIP_TTL_SECONDS)
+
+                elif to_layout == "keys" and key_type == "hash":
+                    mapping = {_decode(k): _decode(v) for k, v in (await pipe.hgetall(idx_key)).items()}
+
+                    pipe.multi()
+                    pipe.delete(idx_key, written_key(location_id))
+                    for tid, value in mapping.items():
+                        pipe.set(trip_key(tid), value, ex=TRIP_TTL_SECONDS)
+                    if mapping:
+                        pipe.sadd(idx_key, *mapping.keys())
+                        pipe.expire(idx_key, TRIP_TTL_SECONDS)
+
+                else:
+                    await pipe.unwatch()
+                    return 0
+
+                await pipe.execute()
+                return len(mapping)
+            except WatchError:
+                continue
+
+
+async def migrate(redis, to_layout: str) -> dict:
+    """Migra todas las locations cacheadas (SCAN loc:*:trips)."""
+    if to_layout not in LAYOUTS:
+        raise ValueError(f"Unknown trip cache layout: {to_layout}")
+
+    locations = 0
+    trips = 0
+    async for key in redis.scan_iter(match="loc:*:trips", count=500):
+        location_id = _decode(key).split(":", 2)[1]
+        migrated = await migrate_location(redis, location_id, to_layout)
+        if migrated:
+            locations += 1
+            trips += migrated
+
+    return {"layout": to_layout, "locations": locations, "trips": trips}
+
+
+async def _main() -> None:
+    from shared.redis.redis_client import redis_client
+
+    parser = argparse.ArgumentParser(description="Trip cache layout tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    mig = sub.add_parser("migrate", help="convert cached locations to another layout")
+    mig.add_argument("--to", choices=LAYOUTS, default=TRIP_CACHE_LAYOUT)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        print(await migrate(redis_client, args.to), flush=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
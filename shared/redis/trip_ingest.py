@@ -0,0 +1,194 @@
+"""
+Aplicación de batches de eventos de trips sobre Redis.
+
+Lógica común a los dos caminos de entrada:
+  - webhook HTTP (features/trips/webhooks/trip_webhooks.py)
+  - sink directo del streaming (services/streaming/trip_streaming.py,
+    STREAMING_SINK=redis), que se salta el encode/HMAC/POST/decode.
+
+Por batch: dedup por batch_id/event_id, escrituras del cache y 1 publish
+por location, todo en un solo MULTI/EXEC.
+"""
+from collections import defaultdict
+
+import orjson
+
+from shared.metrics import TRIP_INGEST_EVENTS, observe_events
+
+from shared.redis.trip_log import queue_publish_batch, load_scripts, is_noscript
+from shared.redis.trip_cache import cache_trip, uncache_trip, touch_location
+from shared.redis.webhook_dedup import claim_events, mark_batch_done, release_events
+
+
+def _safe_str(x) -> str:
+    return str(x or "").strip()
+
+
+def encode_pub_event(
+    location_id: str,
+    trip_id: str,
+    event_type: str,
+    trip_json: bytes | None = None,
+    origin_ts: float | None = None,
+) -> bytes:
+    """
+    Arma el JSON del evento para pub/sub a partir de piezas ya serializadas:
+    el trip se codifica una sola vez y se reutiliza para el cache y el publish.
+    origin_ts viaja hasta la API para medir la latencia commit -> socket.
+    """
+    out = (
+        b'{"location_id":' + orjson.dumps(location_id)
+        + b',"trip_id":' + orjson.dumps(trip_id)
+        + b',"event_type":' + orjson.dumps(event_type)
+    )
+    if trip_json is not None:
+        out += b',"trip":' + trip_json
+    if isinstance(origin_ts, (int, float)):
+        out += b',"origin_ts":' + orjson.dumps(origin_ts)
+    return out + b"}"
+
+
+def process_event_into_pipe(event: dict, pipe):
+    """
+    Mete comandos Redis al pipeline según el event_type (el TTL de la
+    location lo renueva apply_trip_events, 1 vez por location).
+    Retorna (location_id, pub_event) o None si inválido; pub_event es el
+    evento ya serializado (bytes JSON) listo para el batch de pub/sub.
+    """
+    location_id = _safe_str(event.get("location_id"))
+    trip_id = _safe_str(event.get("trip_id"))
+    event_type = _safe_str(event.get("event_type") or event.get("event") or "db_update")
+
+    # El trip puede venir como dict (update/insert) o (delete) también dict con estado anterior
+    trip = event.get("trip")
+    origin_ts = event.get("origin_ts")
+
+    if not location_id or not trip_id:
+        return None
+
+    # Si delete: borra el trip del cache de la location (en vez de set)
+    if event_type == "delete":
+        uncache_trip(pipe, location_id, trip_id)
+
+        pub_event = encode_pub_event(location_id, trip_id, "delete", origin_ts=origin_ts)
+        return location_id, pub_event
+
+    # insert/update: requiere trip dict (mínimo)
+    if not isinstance(trip, dict):
+        return None
+
+    # 1 solo encode del trip: mismo bytes para el cache y para el pubsub
+    trip_json = orjson.dumps(trip)
+    cache_trip(pipe, location_id, trip_id, trip_json)
+
+    pub_event = encode_pub_event(location_id, trip_id, event_type or "db_update", trip_json, origin_ts)
+    return location_id, pub_event
+
+
+async def _retry_missing_scripts(redis, results: list, publish_at: dict) -> None:
+    """
+    Si Redis perdió el script (restart/SCRIPT FLUSH) los EVALSHA fallan con
+    NOSCRIPT pero el resto del MULTI se aplicó: cargamos el script y
+    reintentamos solo esos publishes. Cualquier otro error se propaga.
+    """
+    retry = [publish_at[i] for i, res in enumerate(results) if i in publish_at and is_noscript(res)]
+
+    if retry:
+        await load_scripts(redis)
+        pipe = redis.pipeline(transaction=True)
+        for location_id, items in retry:
+            queue_publish_batch(pipe, location_id, items)
+        results = await pipe.execute(raise_on_error=False)
+
+    for res in results:
+        if isinstance(res, Exception):
+            raise res
+
+
+async def apply_trip_events(redis, events: list, batch_id: str = "") -> dict:
+    """
+    Aplica un batch de eventos (dicts) en Redis. Retorna los contadores
+    received/accepted/skipped/duplicates. Si Redis falla la excepción se
+    propaga y el batch puede reintentarse completo.
+    """
+    # 0) Idempotencia: el streaming reintenta batches completos. Un batch ya
+    #    aplicado se descarta entero; si no, cada event_id se reclama con
+    #    SET NX y los ya vistos se descartan antes del pipeline y el publish.
+    observe_events("received", events)
+
+    batch_id = _safe_str(batch_id)
+    event_ids = [_safe_str(ev.get("event_id")) if isinstance(ev, dict) else "" for ev in events]
+    batch_seen, claimed = await claim_events(redis, batch_id, event_ids)
+
+    if batch_seen:
+        TRIP_INGEST_EVENTS.labels("duplicate").inc(len(events))
+        return {"received": len(events), "accepted": 0, "skipped": 0, "duplicates": len(events)}
+
+    # 1) Redis pipeline (MULTI/EXEC): 1 ejecución para todo el batch,
+    #    cache + publish de todas las locations en el mismo round trip
+    pipe = redis.pipeline(transaction=True)
+
+    # 2) Agrupar pubsub por location para publicar menos mensajes
+    by_location = defaultdict(list)
+    applied = []
+
+    accepted = 0
+    skipped = 0
+    duplicates = 0
+
+    for ev, is_new in zip(events, claimed):
+        if not isinstance(ev, dict):
+            skipped += 1
+            continue
+
+        if not is_new:
+            duplicates += 1
+            continue
+
+        out = process_event_into_pipe(ev, pipe)
+        if not out:
+            skipped += 1
+            continue
+
+        location_id, pub_event = out
+        by_location[location_id].append(pub_event)
+        applied.append(ev)
+        accepted += 1
+
+    # mantenemos TTL del índice para que se limpie solo si queda vacío/abandonado
+    for location_id in by_location:
+        touch_location(pipe, location_id)
+
+    # 3) Pub/Sub: 1 publish por location (no 1 por evento), dentro del MULTI.
+    #    Cada batch lleva un seq por location y queda en el log de replay.
+    #    El JSON del batch se arma con los eventos ya serializados.
+    publish_at = {}
+    for location_id, items in by_location.items():
+        publish_at[len(pipe)] = (location_id, items)
+        queue_publish_batch(pipe, location_id, items)
+
+    new_ids = [eid for eid, is_new in zip(event_ids, claimed) if is_new]
+    mark_batch_done(pipe, batch_id, new_ids)
+
+    if len(pipe):
+        try:
+            results = await pipe.execute(raise_on_error=False)
+            await _retry_missing_scripts(redis, results, publish_at)
+        except BaseException:
+            # el batch no se aplicó (o no entero): soltamos los claims y la
+            # marca del batch, que ya pudo quedar escrita, para que el reintento
+            # entre. Si ni esto corre (crash) los claims vencen con su TTL corto
+            await release_events(redis, new_ids, batch_id)
+            raise
+
+    observe_events("published", applied)
+    TRIP_INGEST_EVENTS.labels("accepted").inc(accepted)
+    TRIP_INGEST_EVENTS.labels("skipped").inc(skipped)
+    TRIP_INGEST_EVENTS.labels("duplicate").inc(duplicates)
+
+    return {
+        "received": len(events),
+        "accepted": accepted,
+        "skipped": skipped,
+        "duplicates": duplicates,
+    }
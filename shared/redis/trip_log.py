@@ -0,0 +1,250 @@
+"""
+Log de replay por location para los batches de trips.
+
+Cada batch publicado recibe un `seq` monótono por location (INCR) y se guarda
+en un Redis Stream acotado (`XADD ... MAXLEN ~`) con ID explícito `<seq>-0`,
+así un cliente que se reconecta con `last_seq` puede pedir solo lo que perdió
+con un XRANGE. Si el hueco ya fue recortado del stream -> snapshot completo.
+
+El mismo stream es el bus de cambios cuando TRIP_BUS_MODE = "stream": los
+workers de la API lo leen con XREAD y un cursor por proceso (cada worker
+necesita todos los eventos de sus rooms, así que no se usan consumer groups),
+y un worker que se reinicia o pierde la conexión continúa desde su cursor.
+Con "pubsub" (default) además se hace PUBLISH fire-and-forget.
+"""
+import hashlib
+from typing import Optional
+
+import orjson
+from redis.exceptions import NoScriptError
+
+from shared.settings import settings
+
+TRIP_LOG_MAXLEN = settings.TRIP_LOG_MAXLEN
+TRIP_BUS_MODE = settings.TRIP_BUS_MODE
+BUS_MODES = ("pubsub", "stream")
+
+
+def seq_key(location_id: str) -> str:
+    return f"loc:{location_id}:seq"
+
+
+def log_key(location_id: str) -> str:
+    return f"loc:{location_id}:log"
+
+
+def channel_key(location_id: str) -> str:
+    return f"loc:{location_id}"
+
+
+# KEYS: seq, log, channel | ARGV: maxlen, cuerpo del mensaje sin la "{" inicial,
+# "1" si además hay que hacer PUBLISH (modo pubsub).
+# El seq se inyecta en el JSON por concatenación para no decodificar en Lua.
+_PUBLISH_BATCH_LUA = """
+local seq = redis.call('INCR', KEYS[1])
+if seq == 1 then
+  local last = redis.call('XREVRANGE', KEYS[2], '+', '-', 'COUNT', 1)
+  if last[1] then
+    seq = tonumber(string.match(last[1][1], '^(%d+)')) + 1
+    redis.call('SET', KEYS[1], seq)
+  end
+end
+local msg = '{"type":"trips_batch","seq":' .. seq .. ',' .. ARGV[2]
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[1], seq .. '-0', 'data', msg)
+if ARGV[3] == '1' then
+  redis.call('PUBLISH', KEYS[3], msg)
+end
+return seq
+"""
+
+PUBLISH_BATCH_SHA = hashlib.sha1(_PUBLISH_BATCH_LUA.encode("utf-8")).hexdigest()
+
+
+async def load_scripts(redis) -> None:
+    """Carga los scripts en Redis (tras un restart/SCRIPT FLUSH)."""
+    await redis.script_load(_PUBLISH_BATCH_LUA)
+
+
+def is_noscript(result) -> bool:
+    return isinstance(result, NoScriptError)
+
+
+def encode_batch_body(location_id: str, encoded_events: list) -> bytes:
+    """
+    Cuerpo del batch (sin la "{" inicial, la pone el script junto al seq)
+    armado con eventos ya serializados a JSON (bytes), sin re-encodearlos.
+    """
+    return (
+        b'"location_id":' + orjson.dumps(location_id)
+        + b',"events":[' + b",".join(encoded_events) + b"]}"
+    )
+
+
+def queue_publish_batch(pipe, location_id: str, encoded_events: list) -> None:
+    """
+    Encola en un pipeline (o MULTI) el EVALSHA que asigna seq, guarda el
+    batch en el log de la location y lo publica en loc:{location_id}.
+    Así las escrituras del cache y las notificaciones van en 1 round trip.
+    Si Redis no tiene el script el resultado es NoScriptError (ver is_noscript).
+    """
+    pipe.evalsha(
+        PUBLISH_BATCH_SHA,
+        3,
+        seq_key(location_id),
+        log_key(location_id),
+        channel_key(location_id),
+        TRIP_LOG_MAXLEN,
+        encode_batch_body(location_id, encoded_events),
+        "1" if TRIP_BUS_MODE == "pubsub" else "0",
+    )
+
+
+async def publish_encoded_batch(redis, location_id: str, encoded_events: list) -> int:
+    """
+    Publica un solo batch fuera de un pipeline (atómico, 1 script).
+    Retorna el seq asignado.
+    """
+    for attempt in range(2):
+        pipe = redis.pipeline(transaction=False)
+        queue_publish_batch(pipe, location_id, encoded_events)
+        (seq,) = await pipe.execute(raise_on_error=False)
+        if is_noscript(seq) and attempt == 0:
+            await load_scripts(redis)
+            continue
+        if isinstance(seq, Exception):
+            raise seq
+        return int(seq)
+
+
+async def publish_location_batch(redis, location_id: str, events: list) -> int:
+    """Igual que publish_encoded_batch, pero con eventos como dicts."""
+    return await publish_encoded_batch(redis, location_id, [orjson.dumps(ev) for ev in events])
+
+
+async def current_seq(redis, location_id: str) -> int:
+    value = await redis.get(seq_key(location_id))
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def parse_stream_seq(entry_id) -> int:
+    if isinstance(entry_id, (bytes, bytearray)):
+        entry_id = entry_id.decode("utf-8", errors="ignore")
+    return int(str(entry_id).split("-", 1)[0])
+
+
+async def read_log_since(redis, location_id: str, last_seq: int) -> Optional[list]:
+    """
+    Retorna los batches (dicts "trips_batch" con `seq`) posteriores a last_seq,
+    en orden. Retorna None si no se puede reanudar (hueco recortado del log,
+    log reiniciado o last_seq inválido) -> el caller debe mandar snapshot.
+    """
+    if last_seq is None or last_seq < 0:
+        return None
+
+    head = await current_seq(redis, location_id)
+    if last_seq > head:
+        return None
+    if last_seq == head:
+        return []
+
+    entries = await redis.xrange(log_key(location_id), min=f"{last_seq + 1}-0", max="+")
+    if not entries or parse_stream_seq(entries[0][0]) != last_seq + 1:
+        return None
+
+    batches = []
+    for _entry_id, fields in entries:
+        data = fields.get("data") if isinstance(fields, dict) else None
+        try:
+            batches.append(orjson.loads(data))
+        except Exception:
+            return None
+    return batches
+
+
+# ----------------- BUS READERS -----------------
+
+class PubSubBatchReader:
+    """Lee batches del canal loc:{location_id} (fire-and-forget)."""
+
+    def __init__(self, redis, location_id: str) -> None:
+        self.redis = redis
+        self.location_id = location_id
+        self.pubsub = None
+
+    async def open(self) -> None:
+        await self.close()
+        self.pubsub = self.redis.pubsub()
+        await self.pubsub.subscribe(channel_key(self.location_id))
+
+    async def read(self, timeout: Optional[float]) -> list:
+        msg = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if not msg or msg.get("type") != "message":
+            return []
+        return [msg.get("data")]
+
+    async def close(self) -> None:
+        if self.pubsub is None:
+            return
+        try:
+            await self.pubsub.unsubscribe(channel_key(self.location_id))
+            await self.pubsub.close()
+        except Exception:
+            pass
+        self.pubsub = None
+
+
+class StreamBatchReader:
+    """
+    Lee batches del log loc:{location_id}:log con XREAD BLOCK y un cursor
+    propio (el último seq leído). Al reabrir tras un error sigue desde el
+    cursor, así no se pierden eventos mientras sigan dentro del MAXLEN.
+
+    Si el seq de la location se reinició (keys borradas/expiradas, flush) el
+    cursor queda adelante del stream y XREAD no entregaría nada hasta que el
+    seq lo alcance: tras un BLOCK completo sin datos se compara con
+    current_seq y el cursor vuelve al seq actual.
+    """
+
+    BLOCK_MS = 5_000
+    COUNT = 100
+
+    def __init__(self, redis, location_id: str) -> None:
+        self.redis = redis
+        self.location_id = location_id
+        self.cursor: Optional[int] = None
+
+    async def open(self) -> None:
+        if self.cursor is None:
+            self.cursor = await current_seq(self.redis, self.location_id)
+
+    async def read(self, timeout: Optional[float]) -> list:
+        block = self.BLOCK_MS if timeout is None else max(1, int(timeout * 1000))
+        resp = await self.redis.xread(
+            {log_key(self.location_id): f"{self.cursor}-0"},
+            count=self.COUNT,
+            block=block,
+        )
+
+        out = []
+        for _stream, entries in resp or []:
+            for entry_id, fields in entries:
+                self.cursor = parse_stream_seq(entry_id)
+                out.append(fields.get("data") if isinstance(fields, dict) else None)
+
+        if not out and timeout is None:
+            head = await current_seq(self.redis, self.location_id)
+            if self.cursor > head:
+                self.cursor = head
+        return out
+
+    async def close(self) -> None:
+        pass
+
+
+def batch_reader(redis, location_id: str, mode: Optional[str] = None):
+    if (mode or TRIP_BUS_MODE) == "stream":
+        return StreamBatchReader(redis, location_id)
+    return PubSubBatchReader(redis, location_id)
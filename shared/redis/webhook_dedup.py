@@ -0,0 +1,102 @@
+"""
+Idempotencia del webhook de trips.
+
+El streaming reintenta batches completos (hasta 8 veces) y cada evento trae
+un event_id único; sin dedup un batch reintentado se cachea y se difunde dos
+veces. Guardamos los ids vistos como keys con TTL:
+
+    SET webhook:batch:{batch_id} 1 EX ttl          (batch ya aplicado)
+    SET webhook:event:{event_id} 1 NX EX claim_ttl (claim por evento)
+    EXPIRE webhook:event:{event_id} ttl            (evento aplicado)
+
+El claim por evento es SET NX: el primero que lo gana lo procesa, los demás
+son duplicados. El claim nace con un TTL corto y se extiende al TTL completo
+en el mismo MULTI que aplica el batch: si el proceso muere o la request se
+cancela entre el claim y el EXEC, el claim vence solo y el reintento entra.
+Si el pipeline principal falla hay que liberar los claims y la marca del
+batch (release_events) para que el reintento del streaming no se descarte:
+la marca viaja en el mismo MULTI y Redis no hace rollback de los demás
+comandos cuando uno falla.
+"""
+from shared.settings import settings
+
+WEBHOOK_DEDUP_TTL_SECONDS = settings.WEBHOOK_DEDUP_TTL_SECONDS
+WEBHOOK_CLAIM_TTL_SECONDS = settings.WEBHOOK_CLAIM_TTL_SECONDS
+
+
+def batch_key(batch_id: str) -> str:
+    return f"webhook:batch:{batch_id}"
+
+
+def event_key(event_id: str) -> str:
+    return f"webhook:event:{event_id}"
+
+
+# KEYS[1] = batch key ("" si no hay batch_id), KEYS[2..] = event keys
+# ARGV[1] = ttl del claim. Retorna {batch_seen, claimed_1, ..., claimed_n}
+_CLAIM_LUA = """
+local ttl = tonumber(ARGV[1])
+local out = {0}
+if KEYS[1] ~= '' and redis.call('EXISTS', KEYS[1]) == 1 then
+  out[1] = 1
+end
+for i = 2, #KEYS do
+  if redis.call('SET', KEYS[i], '1', 'NX', 'EX', ttl) then
+    out[i] = 1
+  else
+    out[i] = 0
+  end
+end
+return out
+"""
+
+_scripts: dict = {}
+
+
+def _claim_script(redis):
+    script = _scripts.get(id(redis))
+    if script is None:
+        script = _scripts[id(redis)] = redis.register_script(_CLAIM_LUA)
+    return script
+
+
+async def claim_events(redis, batch_id: str, event_ids: list) -> tuple:
+    """
+    1 comando (script Lua): verifica el batch_id y hace SET NX de cada
+    event_id. Retorna (batch_seen, claimed) donde claimed[i] es False si
+    event_ids[i] ya se vio (o se repite dentro del mismo batch). Los ids
+    vacíos no se deduplican (siempre True).
+    """
+    keys = [event_key(event_id) for event_id in event_ids if event_id]
+    if not batch_id and not keys:
+        return False, [True] * len(event_ids)
+
+    out = await _claim_script(redis)(
+        keys=[batch_key(batch_id) if batch_id else "", *keys],
+        args=[WEBHOOK_CLAIM_TTL_SECONDS],
+    )
+
+    flags = iter(out[1:])
+    claimed = [bool(next(flags)) if event_id else True for event_id in event_ids]
+    return bool(out[0]), claimed
+
+
+def mark_batch_done(pipe, batch_id: str, event_ids: list) -> None:
+    """
+    Encola en el pipeline la marca de batch aplicado y extiende los claims
+    de event_ids (los ganados en claim_events) al TTL completo.
+    """
+    for event_id in event_ids:
+        if event_id:
+            pipe.expire(event_key(event_id), WEBHOOK_DEDUP_TTL_SECONDS)
+    if batch_id:
+        pipe.set(batch_key(batch_id), "1", ex=WEBHOOK_DEDUP_TTL_SECONDS)
+
+
+async def release_events(redis, event_ids: list, batch_id: str = "") -> None:
+    """Libera claims (y la marca de aplicado) de un batch que no se pudo aplicar."""
+    keys = [event_key(event_id) for event_id in event_ids if event_id]
+    if batch_id:
+        keys.append(batch_key(batch_id))
+    if keys:
+        await redis.delete(*keys)
@@ -18,8 +18,54 @@ class BaseAppSettings(BaseSettings):
     TOKEN_DURATION: str = os.getenv("TOKEN_DURATION")
     JWT_SECRET_KEY: Optional[str] = os.getenv("JWT_SECRET_KEY")
     ALGORITHM: str = os.getenv("ALGORITHM")
+    JWT_BACKEND: str = "auto"
     PEPPER: Optional[str] = os.getenv("PEPPER")
+    AUTH_TOKEN_CACHE_SIZE: int = 10_000
+    AUTH_BLACKLIST_CHECK_SECONDS: float = 5.0
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536
+    ARGON2_PARALLELISM: int = 4
+    ARGON2_WORKERS: int = 0
+    ARGON2_MAX_PENDING: int = 64
     WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET")
+    WEBHOOK_DEDUP_TTL_SECONDS: int = 3600
+    WEBHOOK_CLAIM_TTL_SECONDS: int = 30
+    WEBHOOK_MAX_BODY_BYTES: int = 64 * 1024 * 1024
+    METRICS_TOKEN: Optional[str] = None
+    STREAMING_SINK: str = "http"
+    STREAMING_METRICS_PORT: int = 9100
+    STREAMING_BATCH_ENCODING: str = "gzip"
+    STREAMING_BATCH_FORMAT: str = "json"
+    STREAMING_SENDERS: int = 3
+    STREAMING_MIN_BATCH: int = 100
+    STREAMING_MAX_BATCH: int = 2000
+    STREAMING_MAX_BATCH_BYTES: int = 1_000_000
+    STREAMING_FLUSH_INTERVAL_MS: int = 200
+    STREAMING_PARTITIONS: int = 0
+    STREAMING_REPLICA_ID: str = ""
+    STREAMING_LEASE_MS: int = 10_000
+    STREAMING_HANDOFF_BUFFER: int = 50_000
+    STREAMING_SPILL_DIR: str = "/var/lib/trip-streaming"
+    STREAMING_SPILL_SEGMENT_BYTES: int = 64 * 1024 * 1024
+    STREAMING_SPILL_FSYNC: bool = True
+    RATE_LIMIT_ALGORITHM: str = "fixed"
+    RATE_LIMIT_LEASE_MAX: int = 50
+    RATE_LIMIT_LEASE_FRACTION: int = 20
+    RATE_LIMIT_LOCAL_KEYS: int = 10_000
+    ACCESS_LOG_SAMPLE_RATE: float = 1.0
+    ACCESS_LOG_ROUTE_SAMPLE_RATES: dict[str, float] = {
+        "/health": 0.01,
+        "/ready": 0.01,
+        "/metrics": 0.01,
+    }
+    REDIS_URL: str = "redis://redis:6379/0"
+    TRIP_TTL_SECONDS: int = 300
+    TRIP_CACHE_LAYOUT: str = "keys"
+    WS_COALESCE_WINDOW_MS: int = 0
+    TRIP_LOG_MAXLEN: int = 1000
+    TRIP_BUS_MODE: str = "pubsub"
+    WS_SNAPSHOT_CHUNK_SIZE: int = 500
+    WS_COMPRESS_MIN_BYTES: int = 16384
     PUBLIC_PATHS: list[str] = [
         "/v1/auth/register",
         "/v1/auth/sign-in", 
@@ -35,7 +81,8 @@ class BaseAppSettings(BaseSettings):
         "/health",
         "/ready",
         "/v1/auth/verify-data",
-        "/v1/webhooks/trips"
+        "/v1/webhooks/trips",
+        "/metrics"
     ]
 
     class Config:
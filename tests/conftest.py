@@ -0,0 +1,16 @@
+import os
+
+# settings obligatorios sin default: valores de prueba para importar los módulos
+for name, value in {
+    "POSTGRES_SERVER": "localhost",
+    "POSTGRES_PORT": "5432",
+    "POSTGRES_DB": "test",
+    "POSTGRES_USER": "test",
+    "POSTGRES_PASSWORD": "test",
+    "TOKEN_DURATION": "15",
+    "ALGORITHM": "HS256",
+    "JWT_SECRET_KEY": "test",
+    "WEBHOOK_SECRET": "test",
+    "PEPPER": "test",
+}.items():
+    os.environ.setdefault(name, value)
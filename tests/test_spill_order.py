@@ -0,0 +1,63 @@
+import asyncio
+
+from services.streaming import trip_streaming
+from services.streaming.batch_policy import AdaptiveBatchPolicy
+from services.streaming.spill_queue import SpillQueue
+from services.streaming.trip_streaming import DELIVERED, FAILED, Spill, composer, replayer, sender
+
+
+def trip_event(n: int) -> dict:
+    return {"event_id": str(n), "event_type": "update", "trip_id": str(n), "location_id": "loc-1", "trip": {}}
+
+
+def test_delivery_order_survives_outage(tmp_path, monkeypatch):
+    """Un corte del backend (spill + replay) no debe desordenar los batches de una lane."""
+    delivered: list[int] = []
+    backend_up = asyncio.Event()
+
+    async def deliver(client, redis, batch):
+        # el envío tarda: batch_q se llena mientras el sender reintenta
+        await asyncio.sleep(0.01)
+        if not backend_up.is_set():
+            return FAILED
+        delivered.extend(int(ev["trip_id"]) for ev in batch["events"])
+        return DELIVERED
+
+    monkeypatch.setattr(trip_streaming, "deliver", deliver)
+
+    async def run() -> None:
+        spill = Spill(
+            SpillQueue(str(tmp_path / "spill"), fsync=False),
+            SpillQueue(str(tmp_path / "dead"), fsync=False),
+        )
+        event_q: asyncio.Queue = asyncio.Queue(maxsize=4)
+        batch_q: asyncio.Queue = asyncio.Queue(maxsize=2)
+        policy = AdaptiveBatchPolicy(min_batch=1, max_batch=1, flush_interval_ms=0, senders=1)
+        tasks = [
+            asyncio.create_task(composer(event_q, batch_q, policy)),
+            asyncio.create_task(sender(batch_q, None, None, policy, spill)),
+            asyncio.create_task(replayer(spill, None, None)),
+        ]
+        try:
+            for n in range(10):
+                await event_q.put(trip_event(n))
+            await event_q.join()
+            await batch_q.join()
+
+            backend_up.set()
+            # llegan mientras el replay sigue pendiente: van detrás en el disco
+            for n in range(10, 15):
+                await event_q.put(trip_event(n))
+
+            async def all_delivered() -> None:
+                while len(delivered) < 15:
+                    await asyncio.sleep(0.01)
+
+            await asyncio.wait_for(all_delivered(), timeout=10)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(run())
+    assert delivered == list(range(15))